@@ -0,0 +1,219 @@
+import argparse
+import datetime
+import functools
+import json
+import multiprocessing
+import os
+import platform
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas
+
+from cleaning import clean_column
+from geo import get_us_state, resolve_states
+from metrics import peak_rss_mb
+from neardup import NearDuplicateIndex
+from pipeline import CREATED_AT_FORMAT, get_value_counts, parse_created_at, score_tweets
+from scoring import get_sentiment
+from wordfreq import count_words
+
+BENCHMARK_DIR = os.path.join('data', 'benchmarks')
+DEFAULT_SIZES = [10000, 100000, 1000000]
+MAX_CAMPAIGN_SIZE = 100000
+FIELDNAMES = ['tweet', 'id', 'name', 'location', 'topic', 'created_at', 'processed_on']
+
+topic_hashtags = {'JohnsonAndJohnsonVaccine': ['#JnJVaccine', '#JnJ', '#JohnsonAndJohnsonVaccine'],
+                  'PfizerVaccine': ['#PfizerVaccine', '#Pfizer'],
+                  'ModernaVaccine': ['#ModernaVaccine', '#Moderna'],
+                  'Vaccinated': ['#Vaccinated']}
+other_hashtags = ['#COVID19', '#vaccinated', '#FauciOuchie', '#GetVaccinated', '#covid', '#vaccine', '#VaccinesWork']
+openings = ['Got my second', 'Just got my first', 'Shot #2 of', 'Roughly 24 hours post my second', 'So excited for my',
+            'Finally booked my', 'Day 2 after the', 'Anyone else feel awful after the', 'Fully vaccinated with',
+            'My mom got her', 'RT if you got the', '@CDCgov when is the next']
+subjects = ['shot', 'dose', 'jab', 'vaccine', 'booster', 'appointment']
+comments = ['the only side effects were a sore arm and some drowsiness', 'feeling great, no side effects at all',
+            'worst fever of my life, 101.2 all night', 'arm is so sore I cannot lift it', 'so grateful to the nurses &amp; staff',
+            'why is nobody talking about the blood clots', 'honestly not worth the hype', 'tired but happy',
+            'chills and headache for 12 hrs then fine', 'the line was 3 hours long and nobody wore masks',
+            'looking forward to life getting back closer to "normal" soon', 'I am gonna dress up all fancy like\n\nMakeup\nCool']
+emojis = ['', '', '', ' \U0001F489', ' \U0001F489\U0001FA79', ' \U0001F637', ' \U0001F389\U0001F389', ' \U0001F622', ' :)', ' :(']
+locations = ['', '', '', '', '', 'Austin, TX', 'Florida, USA', 'New York, NY', 'California', 'Chicago, IL', 'Seattle, WA',
+             'Boston, MA', 'Atlanta, Georgia', 'Texas', 'NYC', 'Los Angeles', 'PA', 'Ohio, USA', 'London, England',
+             'India', 'Toronto, Ontario', 'Lagos, Nigeria', 'usually the couch or garden', 'Earth', 'she/her', 'Washington, DC']
+names = ['Anonymous Venting', 'Hannah Lopez', 'Jessie', 'edgar ALLIE poe', 'Dr. Mike', 'Lori \U0001F1EE\U0001F1EA\U0001F1FA\U0001F1F8',
+         'Vaccine News', 'sam', 'The Daily Jab', 'nurse becky']
+words = ('today tomorrow finally honestly really so very still just now already again after before since while my your our '
+         'their arm fever chills headache nausea sleep tired sore pain relief grateful happy scared nervous angry sad '
+         'excited lucky safe protected immune family kids parents grandma nurse doctor pharmacy walgreens cvs clinic '
+         'line wait hours appointment card sticker selfie second first both shots doses side effects symptoms mild bad '
+         'good great terrible awful amazing fine okay normal life back soon summer travel hug friends mask science trust '
+         'data trial fda cdc approval blood clots risk safe efficacy variant spread cases deaths hospital icu please '
+         'everyone go get book yours done finished ready waiting hope love hate wish thank thanks lol omg wow ugh').split()
+campaign = ('Millions have had the {tag} vaccine safely, it protects you and the people around you from severe illness. '
+            'Book your free appointment today at your local pharmacy and help us get back to normal this summer')
+url_chars = np.array(list('abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'))
+
+def generate_tweets(n, topic='PfizerVaccine', duplicate_rate=0.1, seed=0):
+    '''
+    Generates n synthetic tweets with the columns save_tweets_csv writes, newest first like the search results
+    duplicate_rate of them repeat the text of an earlier tweet with a new t.co link, so they only match once cleaned
+    '''
+    rng = np.random.default_rng(seed)
+    pick = lambda values: np.asarray(values, dtype=object)[rng.integers(len(values), size=n)]
+    tags = topic_hashtags.get(topic, ['#'+topic])
+    filler = [' '.join(row[:k]) for row, k in zip(np.asarray(words, dtype=object)[rng.integers(len(words), size=(n, 8))].tolist(),
+                                                   rng.integers(1, 9, size=n).tolist())]
+    texts = (pick(openings) + ' ' + pick(tags) + ' ' + pick(subjects) + ', ' + pick(comments) + ' ' + np.asarray(filler, dtype=object)
+             + np.where(rng.random(n) < 0.4, ' ' + pick(other_hashtags), '') + pick(emojis))
+    links = [''.join(chars) for chars in url_chars[rng.integers(len(url_chars), size=(n, 10))]]
+    duplicates = np.flatnonzero(rng.random(n) < duplicate_rate)
+    duplicates = duplicates[duplicates > 0]
+    texts[duplicates] = texts[rng.integers(duplicates)]
+    texts = texts + np.where(rng.random(n) < 0.8, '… https://t.co/' + np.asarray(links, dtype=object), '')
+    ids = 1392121792244944896 - np.cumsum(rng.integers(1, 4000000000, size=n))
+    created_at = pandas.Timestamp('2021-05-11', tz='UTC') - pandas.to_timedelta(np.cumsum(rng.integers(0, 60, size=n)), unit='s')
+    return pandas.DataFrame({'tweet': texts, 'id': ids, 'name': pick(names), 'location': pick(locations), 'topic': topic,
+                             'created_at': created_at.strftime(CREATED_AT_FORMAT),
+                             'processed_on': '2021-05-11 19:14:10'}, columns=FIELDNAMES)
+
+def generate_campaign(n, topic='PfizerVaccine', seed=0):
+    '''
+    Generates n tweets of a coordinated campaign: one message posted over and over with a word swapped and a new link,
+    near duplicates which all fall into the same LSH buckets
+    '''
+    rng = np.random.default_rng(seed)
+    tweets = generate_tweets(n, topic, 0, seed)
+    message = campaign.format(tag=topic_hashtags.get(topic, ['#'+topic])[0][1:]).split()
+    positions = rng.integers(len(message), size=n)
+    swaps = np.asarray(words, dtype=object)[rng.integers(len(words), size=n)]
+    links = [''.join(chars) for chars in url_chars[rng.integers(len(url_chars), size=(n, 10))]]
+    tweets['tweet'] = [' '.join(message[:k] + [swap] + message[k+1:]) + ' https://t.co/' + link
+                       for k, swap, link in zip(positions.tolist(), swaps.tolist(), links)]
+    return tweets
+
+def write_corpus(n, path, topic='PfizerVaccine', duplicate_rate=0.1, seed=0):
+    '''
+    Writes a synthetic corpus as a csv file laid out like data/csv/<topic>.csv
+    '''
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    generate_tweets(n, topic, duplicate_rate, seed).to_csv(path, index=False)
+    return path
+
+def run_isolated(fn):
+    '''
+    Runs fn() in the worker process of measure, returns its output and wall time with the worker's peak resident set
+    size before and after the call and the largest peak of the processes fn started
+    '''
+    base = peak_rss_mb()
+    start = time.perf_counter()
+    output = fn()
+    seconds = time.perf_counter() - start
+    return output, seconds, {'base_rss_mb': base, 'peak_rss_mb': peak_rss_mb(), 'child_peak_rss_mb': peak_rss_mb(children=True)}
+
+def measure(stage, rows, fn, memory=True, rss=False):
+    '''
+    Runs fn() once for its wall time and, with memory=True, once more under tracemalloc for its peak allocation
+    With rss=True fn, which must then be picklable, runs only once in a freshly spawned process whose peak resident
+    set size is reported instead, with the peak of the pool workers it started, for stages working in other processes
+    which tracemalloc does not see. base_rss_mb is the worker's peak before fn ran, with the modules and input loaded
+    Returns the output of the timed run and the stage's result row
+    '''
+    get_us_state.cache_clear()
+    if memory and rss:
+        # the peak of this process would be the largest of every stage run so far
+        with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('spawn')) as executor:
+            output, seconds, rss_mb = executor.submit(run_isolated, fn).result()
+    else:
+        start = time.perf_counter()
+        output = fn()
+        seconds = time.perf_counter() - start
+    result = {'stage': stage, 'rows': rows, 'seconds': round(seconds, 4), 'rows_per_second': round(rows / seconds) if seconds else None}
+    if memory and rss:
+        result.update(rss_mb)
+    elif memory:
+        get_us_state.cache_clear()
+        tracemalloc.start()
+        fn()
+        result['peak_mb'] = round(tracemalloc.get_traced_memory()[1] / 2**20, 2)
+        tracemalloc.stop()
+    print(result)
+    return output, result
+
+def run_benchmark(n, corpus_dir=BENCHMARK_DIR, workers=None, analyzer='TextBlob', memory=True):
+    '''
+    Times every report stage on a synthetic corpus of n tweets: read, clean, dedup, near duplicate detection, scoring,
+    value counts, state resolution and word-cloud tokenization
+    Near duplicate detection is also timed on a campaign of up to MAX_CAMPAIGN_SIZE near identical tweets
+    '''
+    file = os.path.join(corpus_dir, 'corpus-%d.csv' % n)
+    if not os.path.exists(file):
+        write_corpus(n, file)
+    results = []
+    def step(stage, rows, fn, rss=False):
+        output, result = measure(stage, rows, fn, memory, rss)
+        results.append(dict(result, corpus=n))
+        return output
+
+    tweets = step('read', n, lambda: pandas.read_csv(file, usecols=['tweet', 'location', 'created_at']))
+    keys, cleaned, blank = step('clean', n, lambda: clean_column(tweets['tweet']))
+    keep = step('dedup', n, lambda: ~keys.duplicated() & ~blank)
+    tweets = tweets[keep].assign(tweet_cleaned=cleaned[keep]).reset_index(drop=True)
+    results[-1]['rows_out'] = len(tweets)
+    step('near_dedup', len(tweets), lambda: NearDuplicateIndex().dedup(tweets['tweet_cleaned'], parse_created_at(tweets['created_at'])))
+    _, campaign, _ = clean_column(generate_campaign(min(n, MAX_CAMPAIGN_SIZE))['tweet'])
+    kept = step('near_dedup_campaign', len(campaign), lambda: NearDuplicateIndex().dedup(campaign))
+    results[-1]['rows_out'] = int(kept.sum())
+    # scoring is the longest stage and runs in worker processes, it is not run a second time for tracemalloc
+    tweets['textblob_score'] = step('score', len(tweets), functools.partial(score_tweets, tweets['tweet_cleaned'], analyzer, workers), rss=True)
+    tweets['textblob_sentiment'] = tweets['textblob_score'].apply(get_sentiment)
+    step('value_counts', len(tweets), lambda: get_value_counts('textblob_sentiment', analyzer, tweets))
+    step('states', len(tweets), lambda: resolve_states(tweets['location']))
+    step('words', len(tweets), lambda: count_words(tweets['tweet_cleaned']))
+    return results
+
+def save_results(results, output=None):
+    '''
+    Writes the benchmark results with the environment they were measured in to a json file
+    '''
+    output = output or os.path.join(BENCHMARK_DIR, 'benchmark-%s.json' % datetime.datetime.now().strftime('%Y%m%d%H%M%S'))
+    if os.path.dirname(output):
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+    meta = {'date': datetime.datetime.now().isoformat(' ', 'seconds'), 'python': platform.python_version(),
+            'pandas': pandas.__version__, 'numpy': np.__version__, 'platform': platform.platform(), 'cpus': os.cpu_count()}
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump({'meta': meta, 'results': results}, f, indent=2)
+    print("Saved benchmark to " + output)
+    return output
+
+def compare_results(baseline, current):
+    '''
+    Compares two benchmark json files stage by stage, a ratio above 1 means the current run is slower
+    '''
+    frames = []
+    for path in (baseline, current):
+        with open(path, encoding='utf-8') as f:
+            frames.append(pandas.DataFrame(json.load(f)['results']).set_index(['corpus', 'stage']))
+    comparison = frames[0][['seconds']].join(frames[1][['seconds']], lsuffix='_baseline', rsuffix='_current', how='inner')
+    comparison['ratio'] = (comparison['seconds_current'] / comparison['seconds_baseline']).round(2)
+    print(comparison)
+    return comparison
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, nargs='+', default=DEFAULT_SIZES, help='corpus sizes to benchmark')
+    parser.add_argument('--workers', type=int, help='processes used for scoring')
+    parser.add_argument('--analyzer', choices=['TextBlob', 'Lexicon'], default='TextBlob')
+    parser.add_argument('--no-memory', action='store_true', help='skip the tracemalloc pass and the peak RSS of the stages')
+    parser.add_argument('--output', help='json file for the results')
+    parser.add_argument('--compare', help='benchmark json file to compare the results with')
+    args = parser.parse_args()
+    results = []
+    for n in args.rows:
+        results += run_benchmark(n, workers=args.workers, analyzer=args.analyzer, memory=not args.no_memory)
+    output = save_results(results, args.output)
+    if args.compare:
+        compare_results(args.compare, output)
@@ -0,0 +1,92 @@
+import hashlib
+import os
+import sqlite3
+
+DEFAULT_CACHE_PATH = os.path.join('data', 'cache', 'scores.db')
+DEFAULT_MAX_ENTRIES = 2000000
+BATCH_SIZE = 500
+
+class ScoreCache:
+    '''
+    On-disk cache of polarity scores keyed by a hash of the cleaned tweet and the analyzer version
+    Entries are kept in SQLite, the least recently used ones are evicted above max_entries
+    '''
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_entries=DEFAULT_MAX_ENTRIES):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS scores (key BLOB PRIMARY KEY, score REAL NOT NULL, used INTEGER NOT NULL) WITHOUT ROWID')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS scores_used ON scores (used)')
+        self.clock = self.conn.execute('SELECT COALESCE(MAX(used), 0) FROM scores').fetchone()[0]
+
+    @staticmethod
+    def make_key(text, version):
+        '''
+        Content address of a cleaned tweet for the given analyzer version
+        '''
+        return hashlib.blake2b((version + '\0' + text).encode('utf-8'), digest_size=16).digest()
+
+    def get_many(self, keys):
+        '''
+        Returns {key: score} for the keys present in the cache and marks them as recently used
+        '''
+        self.clock += 1
+        found = {}
+        for i in range(0, len(keys), BATCH_SIZE):
+            batch = keys[i:i + BATCH_SIZE]
+            marks = ','.join('?' * len(batch))
+            found.update(self.conn.execute('SELECT key, score FROM scores WHERE key IN (%s)' % marks, batch))
+            self.conn.execute('UPDATE scores SET used = ? WHERE key IN (%s)' % marks, [self.clock] + batch)
+        self.conn.commit()
+        return found
+
+    def put_many(self, items):
+        '''
+        Stores (key, score) pairs and evicts the least recently used entries above max_entries
+        '''
+        self.clock += 1
+        self.conn.executemany('INSERT OR REPLACE INTO scores (key, score, used) VALUES (?, ?, ?)',
+                              ((key, score, self.clock) for key, score in items))
+        excess = self.conn.execute('SELECT COUNT(*) FROM scores').fetchone()[0] - self.max_entries
+        if excess > 0:
+            self.conn.execute('DELETE FROM scores WHERE key IN (SELECT key FROM scores ORDER BY used LIMIT ?)', (excess,))
+        self.conn.commit()
+
+    def score(self, tweets, version, scorer):
+        '''
+        Returns the scores of the tweets, calling scorer(list_of_tweets) only for the cache misses
+        '''
+        texts = list(tweets)
+        keys = [self.make_key(text, version) for text in texts]
+        unique_keys = list(dict.fromkeys(keys))
+        found = self.get_many(unique_keys)
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+        if missing:
+            computed = [float(score) for score in scorer(list(missing.values()))]
+            found.update(zip(missing.keys(), computed))
+            self.put_many(zip(missing.keys(), computed))
+        return [found[key] for key in keys]
+
+    def stats(self):
+        '''
+        Hit/miss counts since the cache was opened and the number of stored entries
+        '''
+        entries = self.conn.execute('SELECT COUNT(*) FROM scores').fetchone()[0]
+        total = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'entries': entries,
+                'hit_rate': round(self.hits / total * 100, 2) if total else 0.0}
+
+    def close(self):
+        self.conn.close()
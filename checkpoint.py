@@ -0,0 +1,107 @@
+import json
+import os
+import re
+import threading
+
+CHECKPOINT_DIR = os.path.join('data', 'checkpoints')
+
+def checkpoint_path(query, backend='csv'):
+    return os.path.join(CHECKPOINT_DIR, backend, re.sub(r'\W+', '_', query).strip('_')+'.json')
+
+def load_checkpoint(query, backend='csv'):
+    '''
+    Returns the fetch checkpoint of a query
+    An unfinished run is resumed as is, after a finished one a new run starts with since_id at the newest id fetched
+    '''
+    path = checkpoint_path(query, backend)
+    checkpoint = {'query': query, 'since_id': None, 'newest_id': None, 'oldest_id': None, 'complete': True}
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            checkpoint = json.load(f)
+    if checkpoint['complete']:
+        checkpoint.update({'since_id': checkpoint['newest_id'], 'oldest_id': None, 'complete': False})
+    return checkpoint
+
+def save_checkpoint(checkpoint, backend='csv'):
+    path = checkpoint_path(checkpoint['query'], backend)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path+'.tmp', 'w', encoding='utf-8') as f:
+        json.dump(checkpoint, f)
+    os.replace(path+'.tmp', path)
+
+def search_params(checkpoint):
+    '''
+    since_id and max_id for the next page of the checkpoint's run
+    '''
+    params = {}
+    if checkpoint['since_id']:
+        params['since_id'] = checkpoint['since_id']
+    if checkpoint['oldest_id']:
+        params['max_id'] = checkpoint['oldest_id'] - 1
+    return params
+
+def advance_checkpoint(checkpoint, result):
+    '''
+    Moves the checkpoint past a page of search results, in memory only
+    '''
+    ids = [status['id'] for status in result['statuses']]
+    if ids:
+        checkpoint['newest_id'] = max(ids + [checkpoint['newest_id'] or 0])
+        checkpoint['oldest_id'] = min(ids + [checkpoint['oldest_id'] or ids[0]])
+
+def record_page(checkpoint, result, backend='csv'):
+    '''
+    Moves the checkpoint past a stored page of search results and persists it
+    '''
+    advance_checkpoint(checkpoint, result)
+    save_checkpoint(checkpoint, backend)
+
+def finish_checkpoint(checkpoint, backend='csv'):
+    '''
+    Marks the run as done so the next one only asks for tweets newer than what was fetched
+    '''
+    checkpoint['complete'] = True
+    save_checkpoint(checkpoint, backend)
+
+class CheckpointRecorder:
+    '''
+    Persists a query's checkpoint as the BufferedWriter stores its pages, so it never gets ahead of the data on disk
+    The writer calls back in fetch order, after a failed write the checkpoint stays before that page
+    and the next run fetches it again. It also adds up the duplicates the writer skipped in the query's pages
+    '''
+
+    def __init__(self, checkpoint, backend='csv'):
+        self.checkpoint = checkpoint
+        self.backend = backend
+        self.failed = False
+        self.skipped = 0
+        self.done = threading.Event()
+
+    def written(self, result):
+        '''
+        The written(ok, skipped) callback of a page of search results for BufferedWriter.put
+        '''
+        def done(ok, skipped=0):
+            self.failed = self.failed or not ok
+            self.skipped += skipped
+            if not self.failed:
+                record_page(self.checkpoint, result, self.backend)
+        return done
+
+    def finished(self, complete):
+        '''
+        The callback put after the last page, complete when the run reached since_id
+        '''
+        def done(ok, skipped=0):
+            self.failed = self.failed or not ok
+            if complete and not self.failed:
+                finish_checkpoint(self.checkpoint, self.backend)
+            self.done.set()
+        return done
+
+    def wait(self):
+        '''
+        Blocks until every page queued before finished() was written, returns the duplicates skipped in them
+        '''
+        self.done.wait()
+        return self.skipped
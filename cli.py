@@ -0,0 +1,204 @@
+import argparse
+import datetime
+import os
+import subprocess
+import sys
+
+from cache import DEFAULT_CACHE_PATH
+from writer import DEFAULT_FLUSH_SIZE, DEFAULT_FLUSH_INTERVAL
+
+BACKENDS = ['csv', 'parquet', 'mongo']
+# render.RENDER_DIR and neardup.DEFAULT_THRESHOLD, not imported so the cli does not load pandas
+RENDER_DIR = os.path.join('data', 'charts')
+NEAR_DUPLICATE_THRESHOLD = 0.8
+
+# every subcommand imports only what it uses, so a cron driven fetch does not load pandas or the plotting libraries
+# these are the modules each one ends up importing, timed by the imports subcommand
+COMMAND_MODULES = {
+    'fetch': ['main', 'id_index', 'writer'],
+    'report': ['main', 'pipeline', 'store', 'incremental', 'textblob', 'render', 'matplotlib.pyplot', 'seaborn', 'wordcloud'],
+    'map': ['main', 'pipeline', 'store', 'incremental', 'textblob', 'render', 'plotly.express'],
+    'trend': ['main', 'pipeline', 'store', 'incremental', 'rollup', 'textblob'],
+    'export': ['main', 'store', 'mongo_store'],
+    'dedup': ['main', 'mongo_store'],
+    'serve': ['service', 'textblob'],
+}
+
+def fetch(args):
+    import main
+    main.fetch_tweets(args.backend, args.workers, flush_size=args.flush_size, flush_interval=args.flush_interval)
+
+def report_options(args):
+    return dict(workers=args.workers, analyzer=args.analyzer, cache_path=None if args.no_cache else args.cache,
+                incremental=args.incremental, full=args.full, batch_size=args.batch_size, backend=args.backend,
+                near_duplicates=args.near_duplicates)
+
+def report(args):
+    import main
+    return main.generate_report(output_dir=args.output, formats=args.formats, start=args.start, end=args.end, **report_options(args))
+
+def plot_map(args):
+    import main
+    result_copy = main.generate_report(plots=False, **report_options(args))
+    return main.plot_map(result_copy, args.start, args.end, output_dir=args.output, formats=args.formats, workers=args.workers)
+
+def trend(args):
+    '''
+    Sentiment per hour or day read from the rollup cubes, which are first brought up to date incrementally
+    '''
+    import main
+    from metrics import stage
+    from rollup import trend as cube_trend
+    result_copy = main.generate_report(plots=False, **dict(report_options(args), incremental=True))
+    tables = {}
+    for topic in args.topics or list(result_copy):
+        with stage('trend', len(result_copy[topic]['cube'])) as current:
+            tables[topic] = cube_trend(result_copy[topic]['cube'], args.bucket, args.start, args.end, args.state)
+            current.rows_out = len(tables[topic])
+        print(topic)
+        print(tables[topic].to_string())
+    return tables
+
+def export(args):
+    '''
+    --to csv writes the mongodb collections to data/csv, --to parquet imports data/csv into the parquet store
+    '''
+    import main
+    if args.to == 'csv':
+        main.get_docs_csv()
+    else:
+        from store import convert_csv
+        convert_csv(list(main.hashtags))
+
+def dedup(args):
+    '''
+    Removes the tweets stored twice in the mongodb collections and creates their unique id index
+    '''
+    import main
+    from mongo_store import remove_duplicates
+    return {topic: remove_duplicates(topic) for topic in main.hashtags}
+
+def serve(args):
+    '''
+    Runs the scoring service until interrupted
+    '''
+    from service import ScoringService
+    ScoringService(args.analyzer, args.host, args.port, args.socket, args.max_batch, args.max_wait / 1000).serve_forever()
+
+def load_test(args):
+    from benchmark import generate_tweets
+    from service import load_test
+    address = args.socket or 'http://%s:%d' % (args.host, args.port)
+    return load_test(address, list(generate_tweets(1000)['tweet']), args.requests, args.concurrency, args.per_request)
+
+def import_times(args):
+    '''
+    Measures in a fresh interpreter per subcommand how long importing its modules takes
+    '''
+    here = os.path.dirname(os.path.abspath(__file__))
+    for command in args.commands or list(COMMAND_MODULES):
+        code = ('import time\nstart = time.perf_counter()\n' + ''.join('import %s\n' % module for module in COMMAND_MODULES[command])
+                + 'print(round((time.perf_counter() - start) * 1000, 1))')
+        output = subprocess.run([sys.executable, '-c', code], cwd=here, capture_output=True, text=True, check=True)
+        print("%-7s %8s ms" % (command, output.stdout.strip()))
+
+def parse_date(value):
+    return datetime.datetime.fromisoformat(value)
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Fetch and analyse the sentiment of Covid-19 vaccine tweets')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    shared = argparse.ArgumentParser(add_help=False)
+    shared.add_argument('--metrics', nargs='?', const='', help='write per-stage timings to this json file (data/metrics by default)')
+    shared.add_argument('--log-metrics', action='store_true', help='log every finished stage as a json line')
+    shared.add_argument('--profile', action='store_true', help='dump a cProfile of the slowest stage next to the metrics file')
+
+    fetch_parser = subparsers.add_parser('fetch', parents=[shared], help='fetch the tweets of every hashtag and store them')
+    fetch_parser.add_argument('--backend', choices=BACKENDS, default='csv', help='storage the tweets are written to')
+    fetch_parser.add_argument('--workers', type=int, default=4, help='hashtags fetched concurrently')
+    fetch_parser.add_argument('--flush-size', type=int, default=DEFAULT_FLUSH_SIZE, help='records buffered per topic before a write')
+    fetch_parser.add_argument('--flush-interval', type=float, default=DEFAULT_FLUSH_INTERVAL, help='seconds between writes of the buffered records')
+    fetch_parser.set_defaults(run=fetch)
+
+    report_shared = argparse.ArgumentParser(add_help=False, parents=[shared])
+    report_shared.add_argument('--backend', choices=BACKENDS, default='csv', help='storage read by the report')
+    report_shared.add_argument('--analyzer', choices=['TextBlob', 'Lexicon'], default='TextBlob')
+    report_shared.add_argument('--workers', type=int, help='processes used for scoring')
+    report_shared.add_argument('--cache', default=DEFAULT_CACHE_PATH, help='score cache file')
+    report_shared.add_argument('--no-cache', action='store_true', help='score every tweet again')
+    report_shared.add_argument('--incremental', action='store_true', help='only process tweets appended since the last run')
+    report_shared.add_argument('--full', action='store_true', help='rebuild the incremental state from the whole csv files')
+    report_shared.add_argument('--batch-size', type=int, help='stream the tweets in batches of this many rows')
+    report_shared.add_argument('--near-duplicates', type=float, nargs='?', const=NEAR_DUPLICATE_THRESHOLD, metavar='THRESHOLD',
+                               help='also drop tweets this similar to another, keeping the earliest (%s by default)' % NEAR_DUPLICATE_THRESHOLD)
+    report_shared.add_argument('--output', nargs='?', const=RENDER_DIR, help='write the charts headless to files in this directory (%s by default) instead of showing them' % RENDER_DIR)
+    report_shared.add_argument('--format', dest='formats', action='append', help='file format of the charts, repeat for several (png and svg, html and json for maps by default)')
+
+    report_parser = subparsers.add_parser('report', parents=[report_shared], help='bar graphs and word clouds of the sentiment per topic')
+    report_parser.add_argument('--start', type=parse_date, help='bar graphs of the tweets created from this date (YYYY-MM-DD[THH:MM])')
+    report_parser.add_argument('--end', type=parse_date, help='bar graphs of the tweets created before this date (YYYY-MM-DD[THH:MM])')
+    report_parser.set_defaults(run=report)
+
+    map_parser = subparsers.add_parser('map', parents=[report_shared], help='choropleth of the positive sentiment per US state')
+    map_parser.add_argument('--start', type=parse_date, help='only tweets created from this date (YYYY-MM-DD)')
+    map_parser.add_argument('--end', type=parse_date, help='only tweets created before this date (YYYY-MM-DD)')
+    map_parser.set_defaults(run=plot_map)
+
+    trend_parser = subparsers.add_parser('trend', parents=[report_shared], help='sentiment per hour or day from the rollup cubes of the csv files')
+    trend_parser.add_argument('--bucket', choices=['hour', 'day'], default='day', help='time bucket of the trend')
+    trend_parser.add_argument('--start', type=parse_date, help='only the buckets from this date (YYYY-MM-DD[THH:MM])')
+    trend_parser.add_argument('--end', type=parse_date, help='only the buckets before this date (YYYY-MM-DD[THH:MM])')
+    trend_parser.add_argument('--state', help='only the tweets of this US state code')
+    trend_parser.add_argument('--topic', dest='topics', action='append', help='topic to show, repeat for several (all by default)')
+    trend_parser.set_defaults(run=trend)
+
+    export_parser = subparsers.add_parser('export', parents=[shared], help='copy the stored tweets to another backend')
+    export_parser.add_argument('--to', choices=['csv', 'parquet'], default='csv', help='csv exports mongodb, parquet converts the csv files')
+    export_parser.set_defaults(run=export)
+
+    dedup_parser = subparsers.add_parser('dedup', parents=[shared], help='remove the tweets stored twice in mongodb and create the unique id index')
+    dedup_parser.set_defaults(run=dedup)
+
+    service_shared = argparse.ArgumentParser(add_help=False)
+    service_shared.add_argument('--host', default='127.0.0.1', help='address of the scoring service')
+    service_shared.add_argument('--port', type=int, default=8765, help='port of the scoring service')
+    service_shared.add_argument('--socket', help='Unix socket path used instead of host and port')
+
+    serve_parser = subparsers.add_parser('serve', parents=[shared, service_shared], help='keep the analyzer loaded and score tweets over http')
+    serve_parser.add_argument('--analyzer', choices=['TextBlob', 'Lexicon'], default='TextBlob')
+    serve_parser.add_argument('--max-batch', type=int, default=256, help='most texts scored in one batch')
+    serve_parser.add_argument('--max-wait', type=float, default=5.0, help='milliseconds a request waits for others to join its batch')
+    serve_parser.set_defaults(run=serve)
+
+    load_parser = subparsers.add_parser('loadtest', parents=[shared, service_shared], help='send concurrent requests to a running scoring service')
+    load_parser.add_argument('--requests', type=int, default=1000, help='requests sent in total')
+    load_parser.add_argument('--concurrency', type=int, default=16, help='clients sending requests at the same time')
+    load_parser.add_argument('--per-request', type=int, default=1, help='tweets per request')
+    load_parser.set_defaults(run=load_test)
+
+    imports_parser = subparsers.add_parser('imports', help='measure the import time of every subcommand')
+    imports_parser.add_argument('commands', nargs='*', metavar='command', help='subcommands to measure: %s, all by default' % ', '.join(COMMAND_MODULES))
+    imports_parser.set_defaults(run=import_times)
+    return parser
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command in ('report', 'map', 'trend') and args.backend != 'csv' and (args.incremental or args.command == 'trend'):
+        # the incremental state and the rollup cubes follow byte offsets of the csv files
+        parser.error('--incremental and trend read the csv files, --backend %s is not supported' % args.backend)
+    if args.command == 'imports':
+        return args.run(args)
+    from metrics import metrics
+    if args.log_metrics:
+        import logging
+        logging.basicConfig(level=logging.INFO, format='%(message)s')
+    metrics.profile = args.profile
+    result = args.run(args)
+    if args.metrics is not None or args.profile:
+        metrics.write(args.metrics or None)
+    return result
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+import copy
+import threading
+import time
+
+from bson import ObjectId
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from pymongo.results import BulkWriteResult
+
+class FakeCollection:
+    '''
+    In-process stand-in for the parts of a pymongo collection used here: create_index on one field,
+    insert_many, bulk_write of UpdateOne upserts with $setOnInsert, find with equality and $gte/$lt/$in filters, delete_many,
+    estimated_document_count
+    Each call sleeps latency seconds to stand in for a round trip to mongod
+    '''
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.docs = []
+        self.unique = {}
+        self.lock = threading.Lock()
+
+    def round_trip(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def create_index(self, field, unique=False):
+        self.round_trip()
+        with self.lock:
+            if unique and field not in self.unique:
+                values = {doc[field]: doc for doc in self.docs if field in doc}
+                if len(values) < sum(field in doc for doc in self.docs):
+                    raise DuplicateKeyError('E11000 duplicate key error, cannot build the unique index on ' + field, 11000)
+                self.unique[field] = values
+        return field+'_1'
+
+    def lookup(self, filter):
+        if len(filter) == 1:
+            field, value = next(iter(filter.items()))
+            if field in self.unique:
+                return self.unique[field].get(value)
+        return next((doc for doc in self.docs if all(doc.get(k) == v for k, v in filter.items())), None)
+
+    def store(self, doc):
+        for field, values in self.unique.items():
+            if doc.get(field) in values:
+                return False
+        doc.setdefault('_id', ObjectId())
+        self.docs.append(doc)
+        for field, values in self.unique.items():
+            values[doc.get(field)] = doc
+        return True
+
+    def write_errors(self, errors, inserted=0, upserted=()):
+        return BulkWriteError({'writeErrors': errors, 'writeConcernErrors': [], 'nInserted': inserted,
+                               'nUpserted': len(upserted), 'nMatched': 0, 'nModified': 0, 'nRemoved': 0, 'upserted': list(upserted)})
+
+    def insert_many(self, documents, ordered=True):
+        self.round_trip()
+        errors, inserted = [], 0
+        with self.lock:
+            for i, doc in enumerate(documents):
+                if self.store(doc):
+                    inserted += 1
+                else:
+                    errors.append({'index': i, 'code': 11000, 'errmsg': 'E11000 duplicate key error'})
+                    if ordered:
+                        break
+        if errors:
+            raise self.write_errors(errors, inserted)
+
+    def bulk_write(self, requests, ordered=True):
+        self.round_trip()
+        errors, upserted, matched = [], [], 0
+        with self.lock:
+            for i, request in enumerate(requests):
+                if self.lookup(request._filter) is not None:
+                    matched += 1
+                elif request._upsert:
+                    doc = dict(request._filter, **copy.deepcopy(request._doc.get('$setOnInsert', {})))
+                    if self.store(doc):
+                        upserted.append({'index': i, '_id': doc['_id']})
+                    else:
+                        errors.append({'index': i, 'code': 11000, 'errmsg': 'E11000 duplicate key error'})
+                        if ordered:
+                            break
+        if errors:
+            raise self.write_errors(errors, upserted=upserted)
+        return BulkWriteResult({'nInserted': 0, 'nUpserted': len(upserted), 'nMatched': matched, 'nModified': 0,
+                                'nRemoved': 0, 'upserted': upserted, 'writeErrors': [], 'writeConcernErrors': []}, True)
+
+    def matches(self, doc, filter):
+        for field, condition in filter.items():
+            if isinstance(condition, dict):
+                if '$gte' in condition and not doc.get(field) >= condition['$gte']:
+                    return False
+                if '$lt' in condition and not doc.get(field) < condition['$lt']:
+                    return False
+                if '$in' in condition and doc.get(field) not in condition['$in']:
+                    return False
+            elif doc.get(field) != condition:
+                return False
+        return True
+
+    def find(self, filter=None, projection=None, sort=None, batch_size=0):
+        self.round_trip()
+        with self.lock:
+            docs = [doc for doc in self.docs if self.matches(doc, filter or {})]
+        for field, direction in reversed(sort or []):
+            docs.sort(key=lambda doc: doc[field], reverse=direction < 0)
+        keep = [k for k, v in (projection or {}).items() if v and k != '_id']
+        if keep:
+            docs = [dict({k: doc[k] for k in keep if k in doc}, **({'_id': doc['_id']} if projection.get('_id', 1) else {})) for doc in docs]
+        elif projection and not projection.get('_id', 1):
+            docs = [{k: v for k, v in doc.items() if k != '_id'} for doc in docs]
+        return [dict(doc) for doc in docs]
+
+    def estimated_document_count(self):
+        self.round_trip()
+        return len(self.docs)
+
+    def delete_many(self, filter):
+        self.round_trip()
+        with self.lock:
+            self.docs = [doc for doc in self.docs if filter and not self.matches(doc, filter)]
+            for field in self.unique:
+                self.unique[field] = {doc[field]: doc for doc in self.docs if field in doc}
+
+class FakeDatabase:
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.collections = {}
+
+    def __getitem__(self, name):
+        return self.collections.setdefault(name, FakeCollection(self.latency))
+
+class FakeMongoClient:
+    '''
+    client[db][collection] returning FakeCollection objects, so it can stand in for mongo_store.client
+    '''
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.databases = {}
+
+    def __getitem__(self, db):
+        return self.databases.setdefault(db, FakeDatabase(self.latency))
@@ -0,0 +1,103 @@
+import datetime
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, urlparse
+
+import twitter
+
+FIRST_ID = 1392121792244944896
+
+class FakeSearchServer:
+    '''
+    Local stand-in for the search/tweets endpoint which replays paged results shaped like the ones in log.txt
+    Each query has `total` tweets with descending ids up to `newest`, pages honour count, max_id and since_id
+    Raising newest between runs simulates new tweets being posted
+    With rate_limit set, more than that many calls per window seconds get a 429 with x-rate-limit-reset
+    '''
+
+    def __init__(self, total=1000, latency=0.0, rate_limit=None, window=1.0, port=0, newest=FIRST_ID):
+        self.total = total
+        self.newest = newest
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.window = window
+        self.calls = []
+        self.requests = []
+        self.lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', port), self.handler())
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def domain(self):
+        return '127.0.0.1:%d' % self.httpd.server_address[1]
+
+    def api(self):
+        '''
+        A twitter.Twitter client talking to this server
+        '''
+        return twitter.Twitter(auth=twitter.NoAuth(), domain=self.domain, secure=False, api_version='1.1')
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def throttled(self):
+        with self.lock:
+            now = time.time()
+            self.calls.append(now)
+            if self.rate_limit is None:
+                return None
+            recent = [t for t in self.calls if t > now - self.window]
+            if len(recent) > self.rate_limit:
+                return recent[0] + self.window
+        return None
+
+    def page(self, params):
+        self.requests.append(params)
+        query = params.get('q', [''])[0]
+        count = int(params.get('count', ['100'])[0])
+        max_id = int(params.get('max_id', [self.newest])[0])
+        since_id = int(params.get('since_id', ['0'])[0])
+        oldest = self.newest - self.total + 1
+        ids = list(range(min(max_id, self.newest), max(since_id, oldest - 1), -1))[:min(count, 100)]
+        created_at = datetime.datetime(2021, 5, 11, tzinfo=datetime.timezone.utc)
+        statuses = [{'id': i, 'id_str': str(i), 'text': 'Got my #%s shot today %d https://t.co/x' % (query.strip('#').split()[0], i),
+                     'created_at': (created_at - datetime.timedelta(seconds=FIRST_ID - i)).strftime('%a %b %d %H:%M:%S +0000 %Y'),
+                     'user': {'name': 'user %d' % (i % 97), 'location': ['Austin, TX', 'New York', '', 'London'][i % 4]}}
+                    for i in ids]
+        metadata = {'completed_in': self.latency, 'max_id': ids[0] if ids else max_id, 'max_id_str': str(ids[0] if ids else max_id),
+                    'query': quote(query), 'count': len(ids), 'since_id': since_id, 'since_id_str': str(since_id),
+                    'refresh_url': '?since_id=%d&q=%s&include_entities=1' % (ids[0] if ids else max_id, quote(query))}
+        if ids and ids[-1] > max(since_id + 1, oldest):
+            metadata['next_results'] = '?max_id=%d&q=%s&count=%d&include_entities=1' % (ids[-1] - 1, quote(query), count)
+        return {'statuses': statuses, 'search_metadata': metadata}
+
+    def handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                reset = server.throttled()
+                if reset is not None:
+                    body = json.dumps({'errors': [{'code': 88, 'message': 'Rate limit exceeded'}]}).encode('utf-8')
+                    self.send_response(429)
+                    self.send_header('x-rate-limit-reset', str(reset))
+                else:
+                    time.sleep(server.latency)
+                    body = json.dumps(server.page(parse_qs(urlparse(self.path).query))).encode('utf-8')
+                    self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
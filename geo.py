@@ -0,0 +1,55 @@
+from functools import lru_cache
+
+import pandas
+
+from metrics import timed
+
+state_codes = ["AL", "AK", "AZ", "AR", "CA", "CO", "CT", "DC", "DE", "FL", "GA", "HI", "ID", 
+    "IL", "IN", "IA", "KS", "KY", "LA", "ME", "MD", "MA", "MI", "MN", "MS", "MO", 
+    "MT", "NE", "NV", "NH", "NJ", "NM", "NY", "NC", "ND", "OH", "OK", "OR", "PA", 
+    "RI", "SC", "SD", "TN", "TX", "UT", "VT", "VA", "WA", "WV", "WI", "WY"]
+
+states_mapping = { "Alabama": "AL", "Alaska": "AK", "Arizona" : "AZ", "Arkansas": "AR", "California": "CA", 
+    "Colorado": "CO", "Connecticut": "CT", "Washington DC": "DC", "Delaware": "DE", "Florida": "FL", 
+    "Georgia": "GA", "Hawaii": "HI", "Idaho": "ID", "Illinois": "IL", "Indiana": "IN", "Iowa": "IA", 
+    "Kansas": "KS", "Kentucky": "KY", "Louisiana": "LA", "Maine": "ME", "Maryland": "MD", 
+    "Massachusetts": "MA", "Michigan": "MI", "Minnesota": "MN", "Mississippi": "MS", 
+    "Missouri": "MO", "Montana": "MT", "Nebraska": "NE", "Nevada": "NV", "New Hampshire": "NH", 
+    "New Jersey": "NJ", "New Mexico": "NM", "New York": "NY", "North Carolina": "NC", 
+    "North Dakota": "ND", "Ohio": "OH", "Oklahoma": "OK", "Oregon": "OR", "Pennsylvania": "PA", 
+    "Rhode Island": "RI", "South Carolina": "SC", "South Dakota": "SD", "Tennessee": "TN", 
+    "Texas": "TX", "Utah": "UT", "Vermont": "VT", "Virginia": "VA", "Washington": "WA",  
+    "West Virginia": "WV", "Wisconsin": "WI", "Wyoming": "WY" }
+
+# normalized lookups: a comma separated part of a location matches a state when its title case is the state
+# name or when it is exactly the state code
+state_names = dict(states_mapping)
+code_states = {code: state for state, code in states_mapping.items()}
+
+@lru_cache(maxsize=1000000)
+def get_us_state(location):
+    '''
+    Returns the (state code, state name) found in a user location such as "Austin, TX", or (None, None)
+    Results are memoized per raw location string since the same locations repeat across tweets
+    '''
+    if location:
+        for word in str(location).split(','):
+            word = word.strip()
+            code = state_names.get(word.title())
+            if code:
+                return code, code_states[code]
+            if word in code_states:
+                return word, code_states[word]
+    return None, None
+
+@timed('geo', rows_out=lambda result: int(result[0].notna().sum()))
+def resolve_states(locations):
+    '''
+    Resolves a column of locations to (us_state_code, us_state) columns, looking up each distinct location once
+    '''
+    locations = locations.astype(object)
+    uniques = pandas.unique(locations)
+    resolved = [get_us_state(location) for location in uniques]
+    codes = locations.map(dict(zip(uniques, (code for code, _ in resolved))))
+    states = locations.map(dict(zip(uniques, (state for _, state in resolved))))
+    return codes, states
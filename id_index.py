@@ -0,0 +1,143 @@
+import os
+import threading
+
+import numpy as np
+
+INDEX_DIR = os.path.join('data', 'index')
+MERGE_SIZE = 100000
+
+class TweetIdIndex:
+    '''
+    Persistent set of the tweet ids stored for a topic, consulted before writing so each tweet is stored once
+    Ids live in a sorted int64 array plus a set of recent additions, on disk as an append-only int64 file
+    store_size() measures the store (csv bytes, parquet files), it is recorded in <path>.size after every write
+    and the index is built again with bootstrap() when the store is gone or smaller than recorded
+    It also serves as the report's set of dedup keys: path=None keeps it in memory only, and length is the number
+    of ids of the file that were committed, anything appended after them is cut off
+    '''
+
+    def __init__(self, path, bootstrap=None, store_size=None, length=None):
+        self.path = path
+        self.store_size = store_size
+        self.lock = threading.Lock()
+        self.size = self.recorded_size()
+        if path is None:
+            ids = np.asarray(bootstrap() if bootstrap else [], dtype=np.int64)
+        elif os.path.exists(path) and not self.stale():
+            if length is not None and os.path.getsize(path) > length * 8:
+                os.truncate(path, length * 8)
+            ids = np.fromfile(path, dtype=np.int64)
+        else:
+            ids = np.asarray(bootstrap() if bootstrap else [], dtype=np.int64)
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            ids.tofile(path)
+            self.record_size()
+        self.ids = np.unique(ids)
+        self.recent = set()
+
+    def recorded_size(self):
+        if self.path is None or not os.path.exists(self.path+'.size'):
+            return None
+        with open(self.path+'.size', encoding='utf-8') as f:
+            return int(f.read())
+
+    def record_size(self):
+        if self.store_size is None:
+            return
+        self.size = self.store_size()
+        with open(self.path+'.size', 'w', encoding='utf-8') as f:
+            f.write(str(self.size))
+
+    def stale(self):
+        '''
+        True when the store was removed or has shrunk since the index last saw it, e.g. a deleted or rewritten csv
+        '''
+        if self.store_size is None:
+            return False
+        return self.size is None or self.store_size() < self.size
+
+    def __len__(self):
+        return len(self.ids) + len(self.recent)
+
+    def contains(self, ids):
+        '''
+        Returns a boolean mask of the ids which are already in the index
+        '''
+        ids = np.asarray(ids, dtype=np.int64)
+        positions = np.searchsorted(self.ids, ids).clip(max=max(len(self.ids) - 1, 0))
+        found = self.ids[positions] == ids if len(self.ids) else np.zeros(len(ids), dtype=bool)
+        if self.recent:
+            found |= np.fromiter((i in self.recent for i in ids.tolist()), dtype=bool, count=len(ids))
+        return found
+
+    def filter_new(self, tweets, skipped_ids=None):
+        '''
+        Splits tweet records into the ones whose id is not stored yet (first occurrence only) and the number skipped
+        The ids of the skipped ones are appended to skipped_ids when it is given
+        '''
+        if not tweets:
+            return [], 0
+        ids = np.array([int(tweet['id']) for tweet in tweets], dtype=np.int64)
+        _, first = np.unique(ids, return_index=True)
+        keep = np.zeros(len(ids), dtype=bool)
+        keep[first] = True
+        keep &= ~self.contains(ids)
+        if skipped_ids is not None:
+            skipped_ids.extend(ids[~keep].tolist())
+        new = [tweet for tweet, k in zip(tweets, keep) if k]
+        return new, len(tweets) - len(new)
+
+    def add(self, tweets):
+        '''
+        Records the ids of stored tweets, in memory and appended to the index file
+        '''
+        self.add_ids([int(tweet['id']) for tweet in tweets])
+        self.record_size()
+
+    def add_ids(self, ids):
+        '''
+        Records ids which are not in the index yet
+        '''
+        ids = np.asarray(ids, dtype=np.int64)
+        if self.path is not None:
+            with open(self.path, 'ab') as f:
+                ids.tofile(f)
+        self.recent.update(ids.tolist())
+        if len(self.recent) >= MERGE_SIZE:
+            self.ids = np.union1d(self.ids, np.fromiter(self.recent, dtype=np.int64, count=len(self.recent)))
+            self.recent = set()
+
+    def to_array(self):
+        '''
+        Every id of the index as one sorted int64 array
+        '''
+        return np.union1d(self.ids, np.fromiter(self.recent, dtype=np.int64, count=len(self.recent)))
+
+indexes = {}
+indexes_lock = threading.Lock()
+
+def index_path(topic, backend='csv'):
+    return os.path.join(INDEX_DIR, backend, topic+'.ids')
+
+def get_index(topic, backend='csv', bootstrap=None, store_size=None):
+    '''
+    Returns the id index of a topic for a storage backend, loading it once per process
+    bootstrap() returns the ids already stored when the index file does not exist yet or the store shrank,
+    see TweetIdIndex for store_size
+    '''
+    with indexes_lock:
+        key = (backend, topic)
+        if key not in indexes or indexes[key].stale():
+            indexes[key] = TweetIdIndex(index_path(topic, backend), bootstrap, store_size)
+        return indexes[key]
+
+def reset_index(topic, backend='csv'):
+    '''
+    Drops the id index of a topic after its store was rewritten, the next get_index builds it from the store again
+    '''
+    with indexes_lock:
+        indexes.pop((backend, topic), None)
+        for path in (index_path(topic, backend), index_path(topic, backend)+'.size'):
+            if os.path.exists(path):
+                os.remove(path)
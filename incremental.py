@@ -0,0 +1,103 @@
+import json
+import os
+from collections import Counter
+
+from pipeline import iter_batches, record_end, new_aggregate, aggregate_batch, analyzer_version, DEFAULT_BATCH_SIZE
+from neardup import NearDuplicateIndex
+from id_index import TweetIdIndex
+from rollup import load_cube, save_cube
+from scoring import DEFAULT_CHUNK_SIZE, scoring_pool
+
+STATE_DIR = os.path.join('data', 'state')
+STATE_VERSION = 4
+
+def state_path(topic):
+    return os.path.join(STATE_DIR, topic+'.json')
+
+def minhash_path(topic):
+    return os.path.join(STATE_DIR, topic+'-minhash.npz')
+
+def keys_path(topic):
+    return os.path.join(STATE_DIR, topic+'.keys')
+
+def new_state(analyzer, near_duplicates=None):
+    state = new_aggregate(near_duplicates)
+    state.update({'offset': 0, 'rows': 0, 'columns': None, 'analyzer': analyzer_version(analyzer), 'version': STATE_VERSION,
+                  'near_duplicates': near_duplicates})
+    return state
+
+def load_state(topic, analyzer, near_duplicates=None):
+    '''
+    Returns the persisted report state of a topic, or an empty state when there is none for this analyzer and
+    near duplicate threshold, or its rollup cube, MinHash signatures or dedup keys were not saved along with it
+    The dedup keys file is opened for appending, keys written after the state was saved are cut off
+    '''
+    path = state_path(topic)
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            state = json.load(f)
+        if (state.get('analyzer') == analyzer_version(analyzer) and state.get('version') == STATE_VERSION
+                and state.get('near_duplicates') == near_duplicates
+                and os.path.exists(keys_path(topic)) and os.path.getsize(keys_path(topic)) >= state['keys'] * 8):
+            state['cube'] = load_cube(topic, state['analyzer'], state['offset'])
+            state['near_index'] = NearDuplicateIndex.load(minhash_path(topic), near_duplicates, offset=state['offset']) if near_duplicates else None
+            if state['cube'] is not None and (state['near_index'] is not None or not near_duplicates):
+                state['seen'] = TweetIdIndex(keys_path(topic), length=state.pop('keys'))
+                state['words'] = Counter(state['words'])
+                return state
+    return new_state(analyzer, near_duplicates)
+
+def save_state(topic, state):
+    '''
+    Writes the state to data/state/<topic>.json, its rollup cube to data/rollup/<topic>.parquet,
+    its MinHash signatures to data/state/<topic>-minhash.npz and its dedup keys to data/state/<topic>.keys
+    A loaded state has appended its new keys to the keys file already, only a new one writes the whole file
+    '''
+    save_cube(topic, state['cube'], state['analyzer'], state['offset'])
+    if state['near_index'] is not None:
+        state['near_index'].save(minhash_path(topic), state['offset'])
+    os.makedirs(STATE_DIR, exist_ok=True)
+    path = state_path(topic)
+    if state['seen'].path is None:
+        # the old state must not be loaded with the keys of the new one
+        if os.path.exists(path):
+            os.remove(path)
+        state['seen'].to_array().tofile(keys_path(topic)+'.tmp')
+        os.replace(keys_path(topic)+'.tmp', keys_path(topic))
+    with open(path+'.tmp', 'w', encoding='utf-8') as f:
+        json.dump({key: value for key, value in dict(state, keys=len(state['seen'])).items() if key not in ('cube', 'near_index', 'seen')}, f)
+    os.replace(path+'.tmp', path)
+
+def stream_topic(topic, state, analyzer='TextBlob', workers=None, chunk_size=DEFAULT_CHUNK_SIZE, cache=None, batch_size=DEFAULT_BATCH_SIZE, end=None):
+    '''
+    Streams the rows of data/csv/<topic>.csv after the state's byte offset through clean, dedup, score
+    and aggregate in batches of batch_size rows, moving the offset to the end of what was read
+    Only complete records are read up to end (see record_end), a last row still being written is left for the next run
+    '''
+    file = os.path.join('data', 'csv', topic+'.csv')
+    if end is None:
+        end = record_end(file, state['offset'])
+    with scoring_pool(workers) as executor:
+        for tweets in iter_batches(file, batch_size, state['offset'], end, state['columns']):
+            state['columns'] = list(tweets.columns)
+            state = aggregate_batch(state, tweets, analyzer, workers, chunk_size, cache, executor)
+            state['rows'] += len(tweets)
+    state['offset'] = end
+    return state
+
+def update_topic(topic, analyzer='TextBlob', workers=None, chunk_size=DEFAULT_CHUNK_SIZE, cache=None, full=False, batch_size=DEFAULT_BATCH_SIZE, near_duplicates=None):
+    '''
+    Processes only the rows appended to data/csv/<topic>.csv since the last run and persists the new state
+    The watermark is the byte offset read up to, full=True (or a file that shrank) rebuilds from scratch
+    With near_duplicates the appended tweets are checked against the stored MinHash signatures of the older ones,
+    a tweet already counted stays counted even when a near duplicate of it created earlier is appended later
+    '''
+    file = os.path.join('data', 'csv', topic+'.csv')
+    state = new_state(analyzer, near_duplicates) if full else load_state(topic, analyzer, near_duplicates)
+    if os.stat(file).st_size < state['offset']:
+        state = new_state(analyzer, near_duplicates)
+    end = record_end(file, state['offset'])
+    if end > state['offset']:
+        state = stream_topic(topic, state, analyzer, workers, chunk_size, cache, batch_size, end)
+        save_state(topic, state)
+    return state
@@ -0,0 +1,103 @@
+from collections import namedtuple
+from functools import lru_cache
+
+import numpy as np
+import pandas
+
+ANALYZER_NAME = 'Lexicon'
+ANALYZER_VERSION = 'Lexicon-1'
+
+NEGATIONS = ("no", "not", "n't", "never")
+MODIFIERS = ("RB",)
+EXCLAMATION = "!"
+
+Lexicon = namedtuple('Lexicon', ['vocab', 'polarity', 'intensity', 'known', 'modifier', 'negation'])
+
+@lru_cache(maxsize=1)
+def load_lexicon():
+    '''
+    Compiles TextBlob's pattern lexicon (en-sentiment.xml) once into array-backed lookups
+    Row k of every array belongs to vocab[k], the last row is reserved for unknown tokens
+    '''
+    from textblob.en import sentiment
+
+    if dict.__len__(sentiment) == 0:
+        sentiment.load()
+    words = [w for w in dict.keys(sentiment) if ' ' not in w]
+    extra = [w for w in NEGATIONS + (EXCLAMATION,) if w not in sentiment]
+    vocab = pandas.Index(words + extra)
+
+    size = len(vocab) + 1
+    polarity = np.zeros(size)
+    intensity = np.ones(size)
+    known = np.zeros(size, dtype=bool)
+    modifier = np.zeros(size, dtype=bool)
+    for k, w in enumerate(words):
+        p, s, i = dict.__getitem__(sentiment, w)[None]
+        polarity[k] = p
+        intensity[k] = i
+        known[k] = True
+        modifier[k] = any(pos in MODIFIERS for pos in dict.__getitem__(sentiment, w))
+    negation = np.isin(np.append(vocab.to_numpy(dtype=object), ''), NEGATIONS)
+    return Lexicon(vocab, polarity, intensity, known, modifier, negation)
+
+def tokenize(tweets):
+    '''
+    Splits a column of tweets into a flat token array and the row each token belongs to
+    The pair is the coordinate form of a sparse (tweets x vocab) token matrix
+    '''
+    tokens = (pandas.Series(tweets, dtype=object).astype(str).reset_index(drop=True)
+              .str.lower()
+              .str.replace("n't", " n't", regex=False)
+              .str.replace(EXCLAMATION, " ! ", regex=False)
+              .str.replace(r"[^a-z0-9'*!\-]+", " ", regex=True)
+              .str.split()
+              .explode()
+              .dropna())
+    return tokens.index.to_numpy(dtype=np.int64), tokens.to_numpy(dtype=object)
+
+def lexicon_polarity(tweets):
+    '''
+    Scores a whole column of cleaned tweets at once using NumPy reductions over the compiled lexicon
+    Known words are averaged per tweet, a preceding adverb scales the next known word by its intensity
+    and a preceding negation multiplies it by -0.5, approximating TextBlob's PatternAnalyzer rules
+    '''
+    lexicon = load_lexicon()
+    n_rows = len(tweets)
+    rows, tokens = tokenize(tweets)
+    if len(tokens) == 0:
+        return np.zeros(n_rows)
+
+    ids = lexicon.vocab.get_indexer(tokens)
+    ids[ids < 0] = len(lexicon.vocab)
+
+    polarity = lexicon.polarity[ids]
+    known = lexicon.known[ids]
+
+    # token j-1 / j-2 in the same tweet, unknown otherwise
+    unknown = len(lexicon.vocab)
+    prev = np.full_like(ids, unknown)
+    prev[1:] = np.where(rows[1:] == rows[:-1], ids[:-1], unknown)
+    prev2 = np.full_like(ids, unknown)
+    prev2[2:] = np.where(rows[2:] == rows[:-2], ids[:-2], unknown)
+
+    # "very good" is one assessment, scored as good * intensity(very)
+    # "not good" = slightly bad, and "not very good" inverts the intensifier as well
+    modified = known & lexicon.known[prev] & lexicon.modifier[prev]
+    negated = known & lexicon.negation[np.where(modified, prev2, prev)]
+    factor = np.where(modified, lexicon.intensity[prev], 1.0)
+    factor = np.where(modified & negated, 1.0 / factor, factor)
+    polarity = np.clip(polarity * factor, -1.0, 1.0)
+    polarity = np.where(negated, polarity * -0.5, polarity)
+    absorbed = np.zeros_like(known)
+    absorbed[:-1] = modified[1:]
+
+    # exclamation marks boost the previous assessment
+    assessed = known & ~absorbed
+    boosted = np.zeros_like(known)
+    boosted[:-1] = (tokens[1:] == EXCLAMATION) & (rows[1:] == rows[:-1]) & assessed[:-1]
+    polarity = np.where(boosted, np.clip(polarity * 1.25, -1.0, 1.0), polarity)
+
+    totals = np.bincount(rows, weights=np.where(assessed, polarity, 0.0), minlength=n_rows)
+    counts = np.bincount(rows, weights=assessed.astype(float), minlength=n_rows)
+    return totals / np.maximum(counts, 1)
@@ -1,19 +1,23 @@
 import twitter, datetime
 import json
 import csv
+import argparse
+import logging
 from dotenv import load_dotenv 
 import os 
-import pandas
-import preprocessor as p
-import numpy as np
-from textblob import TextBlob
-import seaborn as sns
-import matplotlib.pyplot as plt
-from wordcloud import WordCloud, STOPWORDS
-import plotly.express as px
+# pandas, the NLP and the plotting libraries are imported by the functions using them,
+# so that fetching starts without loading them
+from scoring import DEFAULT_CHUNK_SIZE
+from cache import DEFAULT_CACHE_PATH
+from scheduler import TokenBucket, search_page, run_queries
+from checkpoint import load_checkpoint, search_params, advance_checkpoint, record_page, finish_checkpoint, CheckpointRecorder
+from writer import BufferedWriter, DEFAULT_FLUSH_SIZE, DEFAULT_FLUSH_INTERVAL
+from metrics import metrics, stage
 
 load_dotenv()                  
 
+logger = logging.getLogger(__name__)
+
 topics = ["ModernaVaccine","JohnsonAndJohnsonVaccine", "PfizerVaccine"]
 hashtags = {'JohnsonAndJohnsonVaccine': ['JnJVaccine',  'JohnsonAndJohnsonVaccine'],
             'PfizerVaccine': ['PfizerVaccine', 'Pfizer'],
@@ -52,11 +56,37 @@ def clean_results(result, topic):
         final.append(obj)
     return final
 
-def save_tweets_csv(tweets, topic):
+def stored_csv_ids(topic):
+    '''
+    Ids already saved in data/csv/<topic>.csv, used to build the id index the first time
+    '''
+    import pandas
+    file = os.path.join('data', 'csv', topic+'.csv')
+    if not os.path.exists(file) or os.stat(file).st_size == 0:
+        return []
+    return pandas.read_csv(file, usecols=['id'])['id'].tolist()
+
+def csv_size(topic):
+    '''
+    Size in bytes of data/csv/<topic>.csv, 0 when it does not exist, the size its id index is checked against
+    '''
+    file = os.path.join('data', 'csv', topic+'.csv')
+    return os.path.getsize(file) if os.path.exists(file) else 0
+
+def save_tweets_csv(tweets, topic, skipped_ids=None):
     '''
     This method will help us on saving tweets
+    Tweets whose id is already stored for the topic are skipped, it returns how many were skipped
+    A failed write raises, so the caller does not move its checkpoint past the page
+    The ids of the skipped tweets are appended to skipped_ids when it is given
     '''
-    try:
+    from id_index import get_index
+    index = get_index(topic, 'csv', lambda: stored_csv_ids(topic), lambda: csv_size(topic))
+    with index.lock:
+        tweets, skipped = index.filter_new(tweets, skipped_ids)
+        if not tweets:
+            print("skipped %d duplicates" % skipped)
+            return skipped
         fieldnames = list(tweets[0].keys())
         output_dir = os.path.join('data', 'csv')
         output_file = os.path.join(output_dir, topic+'.csv')
@@ -68,38 +98,65 @@ def save_tweets_csv(tweets, topic):
             if file_empty:
                 writer.writeheader() 
             writer.writerows(tweets)
-        print("done inserting")
-    except Exception as e:
-        print(e)
+        index.add(tweets)
+    print("done inserting, skipped %d duplicates" % skipped)
+    return skipped
 
-def query_tweet(query, count, topic):
+def query_tweet(query, count, topic, save=save_tweets_csv, api=None, limiter=None, backend='csv', writer=None):
     '''
     Queries and finds tweet for different hashtags/topic, it will keep on searching until it finds total count
+    Each page is stored with save, save_tweets_csv or save_tweets_parquet, it returns how many duplicates were skipped
+    or queued to writer, a BufferedWriter, in which case the checkpoint moves once the writer has stored the page
+    and the query returns once its last page is written
+    api and limiter can be shared between concurrent queries, pages are requested through the limiter
+    A checkpoint per query keeps the newest and oldest ids fetched, an interrupted run, or one which stopped at
+    count before reaching since_id, resumes below the oldest and a new run only asks for tweets newer than the last one fetched
     '''
-    api = oauth_login()
+    if api is None:
+        api = oauth_login()
     meta = query.split("-RT")[0].split('#')[1]
-    result = api.search.tweets(q=query, count=500)
-    print(result["search_metadata"])
-    save_tweets_csv(clean_results(result, meta), topic)
-    result_count = result["search_metadata"]["count"]
-    next_max_id = result["search_metadata"]["next_results"].split('max_id=')[1].split('&')[0]
+    checkpoint = load_checkpoint(query, backend)
+    recorder = CheckpointRecorder(checkpoint, backend)
+    # where the next page starts, ahead of the persisted checkpoint while pages wait in the writer
+    cursor = dict(checkpoint)
+    skipped = 0
+    result_count = 0
+    complete = False
     while result_count < count:
-        result = api.search.tweets(q=query, include_entities='true',max_id=next_max_id, count=500 )
+        if recorder.failed:
+            raise RuntimeError("Stopped fetching %s, the writer failed to store a page" % query)
+        result = search_page(api, limiter, q=query, include_entities='true', count=500, **search_params(cursor))
         print(result["search_metadata"])
         print(result_count)
-        save_tweets_csv(clean_results(result, meta), topic)
-        result_count += result["search_metadata"]["count"]
-        if "next_results" in result["search_metadata"]:
-            next_max_id = result["search_metadata"]["next_results"].split('max_id=')[1].split('&')[0]
+        advance_checkpoint(cursor, result)
+        if writer is None:
+            skipped += save(clean_results(result, meta), topic)
+            record_page(checkpoint, result, backend)
         else:
+            writer.put(clean_results(result, meta), topic, recorder.written(result))
+        result_count += result["search_metadata"]["count"]
+        if "next_results" not in result["search_metadata"]:
+            complete = True
             break
+    if writer is None:
+        if complete:
+            # every page down to since_id is stored, the next run starts above the newest id
+            finish_checkpoint(checkpoint, backend)
+    else:
+        writer.put([], topic, recorder.finished(complete))
+        skipped = recorder.wait()
+        if recorder.failed:
+            raise RuntimeError("Stopped fetching %s, the writer failed to store a page" % query)
+    print("Skipped %d duplicate tweets for %s" % (skipped, query))
+    return skipped
         
 def get_docs_csv():   
-     '''
+    '''
     This method is used to download the csv from mongodb 
     '''
-    client = pymongo.MongoClient(mongo)
-    database = client[db]
+    from id_index import reset_index
+    from mongo_store import get_client
+    database = get_client()[os.environ.get('db')]
     for col in topics:
         coll = database[col] 
         try:
@@ -114,215 +171,218 @@ def get_docs_csv():
                 writer = csv.DictWriter(csvfile, fieldnames=fieldnames, extrasaction="ignore")
                 writer.writeheader()
                 writer.writerows(result)
+            # the ids of the old file no longer describe the csv
+            reset_index(col, 'csv')
 
         except Exception as e:
             print(e)
 
-def remove_punctuations(text):
-    '''
-    This method is used to clean the tweets
-    '''
-    punct =['%','/',':','\\','&amp;','&',';']
-    for punctuation in punct:
-        text = text.replace(punctuation, '')
-    return text
-
-def get_value_counts(col_name, analyzer_name, tweets_df):
-    '''
-    This function returns count of the dataset passed, it uses pands library to do the same
-    '''
-    count = pandas.DataFrame(tweets_df[col_name].value_counts())
-    percentage = pandas.DataFrame(tweets_df[col_name].value_counts(normalize=True).mul(100))
-    counts = pandas.concat([count, percentage], axis = 1)
-    counts = counts.reset_index()
-    counts.columns = ['sentiment', 'counts', 'percentage']
-    counts.sort_values('sentiment', inplace = True)
-    counts['percentage'] = counts['percentage'].apply(lambda x: round(x,2))
-    counts = counts.reset_index(drop = True)
-    counts['analyzer'] = analyzer_name
-    return counts
-
-def fetch_tweets():
+def fetch_tweets(backend='csv', workers=4, api=None, limiter=None, flush_size=DEFAULT_FLUSH_SIZE, flush_interval=DEFAULT_FLUSH_INTERVAL):
     '''
     This method fetches and stores the tweets for the last seven days and store it in the mongodb
+    backend='parquet' stores them in the columnar store and backend='mongo' in the mongodb collections instead of the csv files
+    The hashtags are fetched concurrently by workers threads sharing one client and one rate limiter,
+    their pages are written by one background writer in batches of flush_size records or every flush_interval seconds
     '''
+    if backend == 'parquet':
+        from store import save_tweets_parquet as save
+    elif backend == 'mongo':
+        from mongo_store import save_tweets_mongo as save
+    else:
+        save = save_tweets_csv
     try:
-        for key in hashtags.keys():
-            for topic in hashtags[key]:
-                query_tweet("#"+ topic+" -RT AND lang:en", 10000, key)
+        api = api if api is not None else oauth_login()
+        limiter = limiter if limiter is not None else TokenBucket()
+        with BufferedWriter(save, flush_size, flush_interval) as writer:
+            jobs = [("#"+ topic+" -RT AND lang:en", 10000, key, save, api, limiter, backend, writer) for key in hashtags.keys() for topic in hashtags[key]]
+            run_queries(jobs, query_tweet, workers)
         print("Done fetching tweets")
     except Exception as e:
-        print(e)
+        logger.exception(e)
 
-def generate_report():
+def compare_analyzers(topics=topics):
+    '''
+    Reports how often the Lexicon analyzer agrees with TextBlob on the csv files of the given topics
+    '''
+    import numpy as np
+    import pandas
+    from lexicon import ANALYZER_NAME as LEXICON_ANALYZER
+    from pipeline import clean_tweets, score_tweets
+    from scoring import get_sentiment
+    rows = []
+    for topic in topics:
+        file = os.path.join('data', 'csv', topic+'.csv')
+        tweets = clean_tweets(pandas.read_csv(file))['tweet_cleaned']
+        textblob_score = np.array(score_tweets(tweets, 'TextBlob'))
+        lexicon_score = score_tweets(tweets, LEXICON_ANALYZER)
+        textblob_sentiment = [get_sentiment(c) for c in textblob_score]
+        lexicon_sentiment = [get_sentiment(c) for c in lexicon_score]
+        rows.append({'topic': topic, 'tweets': len(tweets),
+                     'agreement': round(float(np.mean(np.array(textblob_sentiment) == np.array(lexicon_sentiment))*100), 2),
+                     'mean_abs_error': round(float(np.mean(np.abs(textblob_score - lexicon_score))), 4)})
+    agreement = pandas.DataFrame(rows)
+    print(agreement)
+    return agreement
+
+def generate_report(workers=None, chunk_size=DEFAULT_CHUNK_SIZE, analyzer='TextBlob', cache_path=DEFAULT_CACHE_PATH, incremental=False, full=False, batch_size=None, backend='csv', plots=True, output_dir=None, formats=None, near_duplicates=None, start=None, end=None):
     '''
     This method is used to generate the report from the csv
+    Sentiment scoring is spread over `workers` processes in chunks of `chunk_size` tweets
+    analyzer selects the scorer, 'TextBlob' or the vectorized 'Lexicon' analyzer
+    Scores are cached on disk at cache_path, pass None to score every tweet again
+    With incremental=True only the rows appended since the last run are processed and merged into the
+    per-topic state kept in data/state, full=True rebuilds that state. The state follows byte offsets of the
+    csv files, so incremental is only available with backend='csv'
+    With batch_size the csv files are streamed in batches of that many rows so memory stays bounded
+    Both modes return the aggregates per topic instead of the cleaned tweets
+    backend='parquet' reads the columnar store and backend='mongo' streams the collections instead of the csv files,
+    only the columns the report uses are read
+    near_duplicates is a similarity threshold (0 to 1) above which tweets are dropped as near duplicates of another,
+    see neardup.NearDuplicateIndex, None only drops exact duplicates
+    start and end restrict the bar graphs to the tweets created in [start, end), see pipeline.sentiment_table,
+    the word clouds still cover every tweet
+    plots=False only returns the results without drawing the bar graphs and word clouds
+    With output_dir the charts are written headless to files in that directory (png and svg unless formats is given)
+    instead of being shown, see render.render_charts
     '''
+    if incremental and backend != 'csv':
+        raise ValueError("incremental reports read the csv files, backend %r is not supported" % backend)
+    from cache import ScoreCache
+    from incremental import update_topic
+    from pipeline import clean_tweets, score_tweets, sentiment_table, iter_batches, stream_report, parse_created_at, DEFAULT_BATCH_SIZE
+    from scoring import get_sentiment
+    from store import load_topic, iter_parquet_batches, REPORT_COLUMNS
+    cache = ScoreCache(cache_path) if cache_path else None
     try:
         topics = ["ModernaVaccine","JohnsonAndJohnsonVaccine", "PfizerVaccine", "Vaccinated"]
         final_bar = []
         result_copy = dict()
         for topic in topics:          
-            file_dir = os.path.join('data', 'csv')
-            file = os.path.join(file_dir, topic+'.csv')
-            result = pandas.read_csv(file)
-            result.sort_values(by="created_at")
-            result_copy[topic] = result.copy()
-            result_copy[topic]['tweet_cleaned'] = result_copy[topic]['tweet'].apply(lambda x: p.clean(x))
-            result_copy[topic].drop_duplicates(subset='tweet_cleaned', keep='first', inplace=True)
-
-            # remove punctuations
-            result_copy[topic]['tweet_cleaned'] = result_copy[topic]['tweet_cleaned'].apply(lambda x: remove_punctuations(x))
-
-            # Drop tweets which have empty text field
-            result_copy[topic]['tweet_cleaned'].replace('', np.nan, inplace=True)
-            result_copy[topic]['tweet_cleaned'].replace(' ', np.nan, inplace=True)
-            result_copy[topic].dropna(subset=['tweet_cleaned'], inplace=True)
-
-            result_copy[topic] = result_copy[topic].reset_index(drop=True)
+            if incremental:
+                result_copy[topic] = update_topic(topic, analyzer, workers, chunk_size, cache, full, batch_size or DEFAULT_BATCH_SIZE, near_duplicates)
+                final_bar.append(sentiment_table(result_copy[topic], analyzer, start, end))
+                continue
+            if batch_size:
+                if backend == 'parquet':
+                    batches = iter_parquet_batches(topic, batch_size, REPORT_COLUMNS)
+                elif backend == 'mongo':
+                    from mongo_store import iter_mongo_batches
+                    batches = iter_mongo_batches(topic, batch_size, REPORT_COLUMNS)
+                else:
+                    batches = iter_batches(os.path.join('data', 'csv', topic+'.csv'), batch_size)
+                result_copy[topic] = stream_report(batches, analyzer, workers, chunk_size, cache, near_duplicates)
+                final_bar.append(sentiment_table(result_copy[topic], analyzer, start, end))
+                continue
+
+            result = load_topic(topic, backend, REPORT_COLUMNS)
+            # parsed once to UTC, the file order is kept so dedup still keeps the first of the duplicates
+            result['created_at'] = parse_created_at(result['created_at'])
+            result_copy[topic] = clean_tweets(result, near_duplicates).set_index('created_at', drop=False).rename_axis(None)
 
             #sentiment analysis
-            # Obtain polarity scores generated by TextBlob
-            result_copy[topic]['textblob_score'] = result_copy[topic]['tweet_cleaned'].apply(lambda x: TextBlob(x).sentiment.polarity)
-            # neutral_thresh = 0.05
+            # Obtain polarity scores generated by the selected analyzer
+            result_copy[topic]['textblob_score'] = score_tweets(result_copy[topic]['tweet_cleaned'], analyzer, workers, chunk_size, cache)
 
             # Convert polarity score into sentiment categories
-            result_copy[topic]['textblob_sentiment'] = result_copy[topic]['textblob_score'].apply(lambda c: 'Positive' if c >= 0.1 else ('Negative' if c <= -(0.1) else 'Neutral'))
+            result_copy[topic]['textblob_sentiment'] = result_copy[topic]['textblob_score'].apply(get_sentiment)
             
-            textblob_sentiment_df = get_value_counts('textblob_sentiment','TextBlob', result_copy[topic])
+            textblob_sentiment_df = sentiment_table(result_copy[topic], analyzer, start, end)
 
             final_bar.append(textblob_sentiment_df)
 
-        # bargraph plotting
-        fig = plt.figure()
-        fig.subplots_adjust(hspace=0.8, wspace=0.8)
-
-        plt.rcParams["figure.figsize"] = (25,8)
+        if cache is not None:
+            print(cache.stats())
+        if not plots:
+            return result_copy
 
-        ax = fig.add_subplot(2, 2, 1)
-        ax.set_title(topics[0])
-        for index, row in final_bar[0].iterrows():
-                ax.text(row.name,row.percentage, round(row.percentage,1), color='black', ha="center")
-        sns.barplot(x="sentiment", y="percentage", data=final_bar[0], ax=ax)
+        from wordfreq import count_words_by_topic, normalize_plurals
 
-        ax = fig.add_subplot(2, 2, 2)
-        ax.set_title(topics[1])
-        for index, row in final_bar[1].iterrows():
-                ax.text(row.name,row.percentage, round(row.percentage,1), color='black', ha="center")
-        sns.barplot(x="sentiment", y="percentage", data=final_bar[1], ax=ax)
+        #worldcloud
+        # word frequencies per topic, counted in parallel or taken from the streaming aggregates
+        if incremental or batch_size:
+            word_counts = {topic: result_copy[topic]['words'] for topic in topics}
+        else:
+            word_counts = count_words_by_topic({topic: result_copy[topic]['tweet_cleaned'] for topic in topics}, workers)
+        word_counts = {topic: normalize_plurals(word_counts[topic]) for topic in topics if word_counts[topic]}
 
-        ax = fig.add_subplot(2, 2, 3)
-        ax.set_title(topics[2])
-        for index, row in final_bar[2].iterrows():
-                ax.text(row.name,row.percentage, round(row.percentage,1), color='black', ha="center")
-        sns.barplot(x="sentiment", y="percentage", data=final_bar[2], ax=ax)
+        if output_dir is not None:
+            # headless: every chart is written to files by its own process, unchanged charts are kept
+            import render
+            charts = [('bars', render.save_bars, formats or render.MATPLOTLIB_FORMATS, (final_bar, topics))]
+            charts += [('wordcloud-' + topic, render.save_wordcloud, formats or render.MATPLOTLIB_FORMATS, (word_counts[topic],)) for topic in word_counts]
+            with stage('render', len(charts)):
+                render.render_charts(charts, output_dir, workers)
+            return result_copy
 
-        # plt.show()
+        import matplotlib.pyplot as plt
+        from render import draw_bars, draw_wordcloud
 
-        #worldcloud
-        # #vaccinated
-        comment_words = ''
-        stopwords = set(STOPWORDS)
-        result_copy['JohnsonAndJohnsonVaccine'].head(10)
-        for topic in topics:
-            for val in result_copy[topic].values:
-                row = val[7]
-                # print(row)
-                tokens = row.split()
-                # Converts each token into lowercase
-                for i in range(len(tokens)):
-                    tokens[i] = tokens[i].lower()
-                
-                comment_words += " ".join(tokens)+" "
-            wordcloud = WordCloud(width = 800, height = 800,
-                            background_color ='black',
-                            stopwords = stopwords,
-                            min_font_size = 10).generate(comment_words)
-            plt.figure(figsize = (8, 8), facecolor = None)
-            plt.imshow(wordcloud)
-            plt.axis("off")
-            plt.tight_layout(pad = 0)
+        # bargraph plotting
+        with stage('plot_bars', sum(len(table) for table in final_bar)):
+            draw_bars(final_bar, topics)
+
+        for topic in word_counts:
+            with stage('plot_wordcloud', len(word_counts[topic])):
+                wordcloud = draw_wordcloud(word_counts[topic])
+                plt.figure(figsize = (8, 8), facecolor = None)
+                plt.imshow(wordcloud)
+                plt.axis("off")
+                plt.tight_layout(pad = 0)
             
-            plt.show()
+                plt.show()
         return result_copy
 
     except Exception as e:
-        print(e)
+        logger.exception(e)
+    finally:
+        if cache is not None:
+            cache.close()
 
-def plot_map(result_copy):
+def plot_map(result_copy, start=None, end=None, output_dir=None, formats=None, workers=None):
     '''
     This method is used for plotting the graph
+    It draws one choropleth of the positive percentage per US state for every topic, optionally for the tweets
+    created in [start, end). result_copy can also hold the aggregates of the streaming or incremental report
+    With output_dir the maps are written to html and json files (or formats) instead of being shown
     '''
-    state_codes = ["AL", "AK", "AZ", "AR", "CA", "CO", "CT", "DC", "DE", "FL", "GA", "HI", "ID", 
-          "IL", "IN", "IA", "KS", "KY", "LA", "ME", "MD", "MA", "MI", "MN", "MS", "MO", 
-          "MT", "NE", "NV", "NH", "NJ", "NM", "NY", "NC", "ND", "OH", "OK", "OR", "PA", 
-          "RI", "SC", "SD", "TN", "TX", "UT", "VT", "VA", "WA", "WV", "WI", "WY"]
-        
-    states_mapping = { "Alabama": "AL", "Alaska": "AK", "Arizona" : "AZ", "Arkansas": "AR", "California": "CA", 
-        "Colorado": "CO", "Connecticut": "CT", "Washington DC": "DC", "Delaware": "DE", "Florida": "FL", 
-        "Georgia": "GA", "Hawaii": "HI", "Idaho": "ID", "Illinois": "IL", "Indiana": "IN", "Iowa": "IA", 
-        "Kansas": "KS", "Kentucky": "KY", "Louisiana": "LA", "Maine": "ME", "Maryland": "MD", 
-        "Massachusetts": "MA", "Michigan": "MI", "Minnesota": "MN", "Mississippi": "MS", 
-        "Missouri": "MO", "Montana": "MT", "Nebraska": "NE", "Nevada": "NV", "New Hampshire": "NH", 
-        "New Jersey": "NJ", "New Mexico": "NM", "New York": "NY", "North Carolina": "NC", 
-        "North Dakota": "ND", "Ohio": "OH", "Oklahoma": "OK", "Oregon": "OR", "Pennsylvania": "PA", 
-        "Rhode Island": "RI", "South Carolina": "SC", "South Dakota": "SD", "Tennessee": "TN", 
-        "Texas": "TX", "Utah": "UT", "Vermont": "VT", "Virginia": "VA", "Washington": "WA",  
-        "West Virginia": "WV", "Wisconsin": "WI", "Wyoming": "WY" }
-
-    for topic in topics:
-        for index, row in result_copy[topic].iterrows():
-            flag = 0
-            if row.location:
-                location_split = str(row.location).split(',')
-                for word in location_split:
-                    word = word.strip()
-                    for state, code in states_mapping.items():
-                        if state == word.title() or code == word:
-                            result_copy[topic].at[index, 'us_state_code'] = code
-                            result_copy[topic].at[index, 'us_state'] = state
-                            flag = 1
-                            break
-                    if flag == 1:
-                        break
-
-    result_states = {}
+    from geo import resolve_states
+    from pipeline import state_sentiment_table
     for topic in topics:
-        result_states[topic] = result_copy[topic][result_copy[topic]['us_state_code'].notna()]
-        topic = 'PfizerVaccine'
-    print(len(result_states[topic]))
-    result_states[topic]['us_state_code'].head(10)
-
-    df_states = []
-    for i in state_codes:
-        dic = {'State':i, 'Positive':0, 'Negative':0, 'Neutral': 0}
-        df_states.append(dic)
-    # now update
-    for ind,row in result_states[topic].iterrows():
-        curr_state = row['us_state_code']
-        for item in df_states:
-            if item['State'] == curr_state:
-                item[row['textblob_sentiment']] = item[row['textblob_sentiment']] + 1
-                break
-
-    #positive percentage
-    for row in df_states:
-        curr_total = int(row['Positive']) + int(row['Negative']) + int(row['Neutral'])
-        row.setdefault('Total',curr_total)
-        if curr_total > 0:
-            row.setdefault('PositivePercentage', round(float(row['Positive']/row['Total']*100),2))
-            row.setdefault('NegativePercentage', round(float(row['Negative']/row['Total']*100),2))
-        else:
-            row.setdefault('PositivePercentage',0)
-            row.setdefault('NegativePercentage',0)
-    # print(pandas.DataFrame(df_states))
-    state_df  = pandas.DataFrame(df_states)
-
-    fig = px.choropleth(state_df, locations='State', locationmode='USA-states', 
-            scope='usa', color = 'PositivePercentage', hover_name='State', hover_data=['Positive','Negative','Neutral'], range_color= [10,90], color_continuous_scale= 'armyrose', title='Covid-19 Vaccine Sentiment Pfizer' )
-    fig.show()
+        if not isinstance(result_copy[topic], dict):
+            result_copy[topic]['us_state_code'], result_copy[topic]['us_state'] = resolve_states(result_copy[topic]['location'])
+
+    state_table = state_sentiment_table({topic: result_copy[topic] for topic in topics}, start, end)
+    if output_dir is not None:
+        import render
+        charts = [('map-' + topic, render.save_map, formats or render.PLOTLY_FORMATS, (state_df, topic))
+                  for topic, state_df in state_table.groupby('topic', sort=False)]
+        with stage('render', len(charts)):
+            render.render_charts(charts, output_dir, workers)
+        return state_table
+
+    from render import draw_map
+    for topic, state_df in state_table.groupby('topic', sort=False):
+        with stage('plot_map', len(state_df)):
+            draw_map(state_df, topic).show()
+    return state_table
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--incremental', action='store_true', help='only process tweets appended since the last run')
+    parser.add_argument('--full', action='store_true', help='rebuild the incremental state from the whole csv files')
+    parser.add_argument('--batch-size', type=int, help='stream the csv files in batches of this many rows')
+    parser.add_argument('--backend', choices=['csv', 'parquet', 'mongo'], default='csv', help='storage read by the report')
+    parser.add_argument('--near-duplicates', type=float, nargs='?', const=0.8, metavar='THRESHOLD', help='also drop tweets this similar to another, keeping the earliest (0.8 by default)')
+    parser.add_argument('--output', nargs='?', const='data/charts', help='write the charts to files in this directory (data/charts by default) instead of showing them')
+    parser.add_argument('--metrics', nargs='?', const='', help='write per-stage timings to this json file (data/metrics by default)')
+    parser.add_argument('--log-metrics', action='store_true', help='log every finished stage as a json line')
+    parser.add_argument('--profile', action='store_true', help='dump a cProfile of the slowest stage next to the metrics file')
+    args = parser.parse_args()
+    if args.log_metrics:
+        logging.basicConfig(level=logging.INFO, format='%(message)s')
+    metrics.profile = args.profile
     # fetch_tweets()
-    result_copy = generate_report()
-    plot_map(result_copy)
+    result_copy = generate_report(incremental=args.incremental, full=args.full, batch_size=args.batch_size, backend=args.backend, output_dir=args.output, near_duplicates=args.near_duplicates)
+    plot_map(result_copy, output_dir=args.output)
+    if args.metrics is not None or args.profile:
+        metrics.write(args.metrics or None)
@@ -1,7 +1,6 @@
 import twitter, datetime
 import json
 import csv
-import pymongo
 from dotenv import load_dotenv 
 import os 
 import pandas
@@ -10,6 +9,11 @@ import numpy as np
 from textblob import TextBlob
 import seaborn as sns
 import matplotlib.pyplot as plt
+from mongo_store import get_client, save_tweets_mongo, read_tweets_mongo
+from id_index import reset_index
+from scheduler import TokenBucket, search_page, run_queries
+from checkpoint import load_checkpoint, search_params, advance_checkpoint, record_page, finish_checkpoint, CheckpointRecorder
+from writer import BufferedWriter, DEFAULT_FLUSH_SIZE, DEFAULT_FLUSH_INTERVAL
 
 load_dotenv()                  
 
@@ -52,45 +56,62 @@ def clean_results(result, query):
         final.append(obj)
     return final
 
-def save_tweets(tweets, topic):
+def save_tweets(tweets, topic, skipped_ids=None):
     '''
     This method will help us on saving tweets on mongodb
+    Tweets whose id is already stored in the collection are skipped, it returns how many were skipped
     '''
-    client = pymongo.MongoClient(mongo)
-    database = client[db]
-    coll = database[topic]
-    try:
-        result = coll.insert_many(tweets)
-        print("done inserting")
-        return result
-    except Exception as e:
-        print(e)
+    return save_tweets_mongo(tweets, topic, db, skipped_ids)
 
-def query_tweet(query, count, topic):
+def query_tweet(query, count, topic, api=None, limiter=None, save=save_tweets, writer=None):
     '''
     Queries and finds tweet for different hashtags/topic, it will keep on searching until it finds total count
+    Each page is stored with save, it returns how many duplicate tweets were skipped
+    or queued to writer, a BufferedWriter, in which case the checkpoint moves once the writer has stored the page
+    and the query returns once its last page is written
+    api and limiter can be shared between concurrent queries, pages are requested through the limiter
+    A checkpoint per query keeps the newest and oldest ids fetched, an interrupted run, or one which stopped at
+    count before reaching since_id, resumes below the oldest and a new run only asks for tweets newer than the last one fetched
     '''
-    api = oauth_login()
-    result = api.search.tweets(q=query, count=500)
-    print(result["search_metadata"])
-    save_tweets(clean_results(result, query), topic)
-    result_count = result["search_metadata"]["count"]
-    next_max_id = result["search_metadata"]["next_results"].split('max_id=')[1].split('&')[0]
+    if api is None:
+        api = oauth_login()
+    checkpoint = load_checkpoint(query, 'mongo')
+    recorder = CheckpointRecorder(checkpoint, 'mongo')
+    # where the next page starts, ahead of the persisted checkpoint while pages wait in the writer
+    cursor = dict(checkpoint)
+    skipped = 0
+    result_count = 0
+    complete = False
     while result_count < count:
-        result = api.search.tweets(q=query, include_entities='true',max_id=next_max_id, count=500 )
+        if recorder.failed:
+            raise RuntimeError("Stopped fetching %s, the writer failed to store a page" % query)
+        result = search_page(api, limiter, q=query, include_entities='true', count=500, **search_params(cursor))
         print(result["search_metadata"])
         print(result_count)
-        save_tweets(clean_results(result, query), topic)
-        result_count += result["search_metadata"]["count"]
-        if "next_results" in result["search_metadata"]:
-            next_max_id = result["search_metadata"]["next_results"].split('max_id=')[1].split('&')[0]
+        advance_checkpoint(cursor, result)
+        if writer is None:
+            skipped += save(clean_results(result, query), topic)
+            record_page(checkpoint, result, 'mongo')
         else:
+            writer.put(clean_results(result, query), topic, recorder.written(result))
+        result_count += result["search_metadata"]["count"]
+        if "next_results" not in result["search_metadata"]:
+            complete = True
             break
+    if writer is None:
+        if complete:
+            # every page down to since_id is stored, the next run starts above the newest id
+            finish_checkpoint(checkpoint, 'mongo')
+    else:
+        writer.put([], topic, recorder.finished(complete))
+        skipped = recorder.wait()
+        if recorder.failed:
+            raise RuntimeError("Stopped fetching %s, the writer failed to store a page" % query)
+    print("Skipped %d duplicate tweets for %s" % (skipped, query))
+    return skipped
         
 def get_docs(col):
-    client = pymongo.MongoClient(mongo)
-    database = client[db]
-    coll = database[col]    
+    coll = get_client(mongo)[db][col]
     try:
         result = coll.find()
         arr = []
@@ -102,8 +123,7 @@ def get_docs(col):
         print(e)
 
 def get_docs_csv():   
-    client = pymongo.MongoClient(mongo)
-    database = client[db]
+    database = get_client(mongo)[db]
     for col in topics:
         coll = database[col] 
         try:
@@ -118,6 +138,8 @@ def get_docs_csv():
                 writer = csv.DictWriter(csvfile, fieldnames=fieldnames, extrasaction="ignore")
                 writer.writeheader()
                 writer.writerows(result)
+            # the ids of the old file no longer describe the csv
+            reset_index(col, 'csv')
 
         except Exception as e:
             print(e)
@@ -146,30 +168,30 @@ def get_value_counts(col_name, analyzer_name, tweets_df):
     counts['analyzer'] = analyzer_name
     return counts
 
-def fetch_tweets():
+def fetch_tweets(workers=4, flush_size=DEFAULT_FLUSH_SIZE, flush_interval=DEFAULT_FLUSH_INTERVAL):
     '''
     This method fetches and stores the tweets for the last seven days and store it in the mongodb
+    The hashtags are fetched concurrently by workers threads sharing one client and one rate limiter,
+    their pages are inserted by one background writer in batches of flush_size records or every flush_interval seconds
     '''
     try:
-        for key in hashtags.keys():
-            for topic in hashtags[key]:
-                query_tweet("#"+ topic+" -RT AND lang:en", 10000, key)
+        api = oauth_login()
+        limiter = TokenBucket()
+        with BufferedWriter(save_tweets, flush_size, flush_interval) as writer:
+            jobs = [("#"+ topic+" -RT AND lang:en", 10000, key, api, limiter, save_tweets, writer) for key in hashtags.keys() for topic in hashtags[key]]
+            run_queries(jobs, query_tweet, workers)
         print("Done fetching tweets")
     except Exception as e:
         print(e)
 
 def generate_report():
     '''
-    This method is used to generate the report from the csv
+    This method is used to generate the report from the collections, streamed straight from mongodb
     '''
     try:
         final = []
         for topic in topics:          
-            # result_from_db = get_docs(topic)
-            # result = pandas.DataFrame(result_from_db)
-            file_dir = os.path.join('data', 'csv')
-            file = os.path.join(file_dir, topic+'.csv')
-            result = pandas.read_csv(file)
+            result = read_tweets_mongo(topic, ['tweet', 'location', 'created_at'], db=db)
             result.sort_values(by="created_at")
             print(result.head(n=5))
             result_copy = result.copy()
@@ -261,4 +283,4 @@ if __name__ == '__main__':
     # fetch_tweets()
     # generate_report()
     # get_docs_csv()
-    
\ No newline at end of file
+    pass
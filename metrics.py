@@ -0,0 +1,173 @@
+import contextlib
+import cProfile
+import datetime
+import functools
+import json
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+METRICS_DIR = os.path.join('data', 'metrics')
+
+logger = logging.getLogger('metrics')
+
+def peak_rss_mb(children=False):
+    '''
+    Peak resident set size of the process so far in MB, None where the resource module is missing
+    children=True gives the largest peak of the child processes which have been waited for, such as finished pool workers
+    '''
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / 2**20 if sys.platform == 'darwin' else peak / 1024, 1)
+
+class Stage:
+    '''
+    A running stage, the instrumented code sets rows_out and api_calls on it
+    '''
+
+    def __init__(self, name, rows_in=None):
+        self.name = name
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.api_calls = 0
+
+class Metrics:
+    '''
+    Wall time, rows in/out, API calls and peak RSS per pipeline stage, totalled over all calls and threads
+    Every finished stage is also logged as one json line on the "metrics" logger
+    With profile=True the outermost stage of each thread runs under cProfile and the stats of the stage
+    with the most wall time are dumped next to the metrics file
+    '''
+
+    def __init__(self, profile=False):
+        self.lock = threading.Lock()
+        self.totals = {}
+        self.profile = profile
+        self.profiles = {}
+        self.profiling = False
+
+    def start_profile(self):
+        with self.lock:
+            if not self.profile or self.profiling:
+                return None
+            self.profiling = True
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # another profiler is already active in this interpreter
+            with self.lock:
+                self.profiling = False
+            return None
+        return profiler
+
+    def stop_profile(self, name, profiler):
+        profiler.disable()
+        with self.lock:
+            if name in self.profiles:
+                self.profiles[name].add(profiler)
+            else:
+                self.profiles[name] = pstats.Stats(profiler)
+            self.profiling = False
+
+    def record(self, stage, seconds, error=None):
+        event = {'stage': stage.name, 'seconds': round(seconds, 4), 'rows_in': stage.rows_in, 'rows_out': stage.rows_out,
+                 'api_calls': stage.api_calls, 'peak_rss_mb': peak_rss_mb()}
+        if error is not None:
+            event['error'] = error
+        with self.lock:
+            total = self.totals.setdefault(stage.name, {'calls': 0, 'errors': 0, 'seconds': 0.0, 'rows_in': 0, 'rows_out': 0, 'api_calls': 0})
+            total['calls'] += 1
+            total['errors'] += error is not None
+            total['seconds'] += seconds
+            total['rows_in'] += stage.rows_in or 0
+            total['rows_out'] += stage.rows_out or 0
+            total['api_calls'] += stage.api_calls
+            total['peak_rss_mb'] = event['peak_rss_mb']
+        if error is None:
+            logger.info(json.dumps(event))
+        else:
+            logger.warning(json.dumps(event))
+
+    @contextlib.contextmanager
+    def stage(self, name, rows_in=None):
+        '''
+        Context manager timing the code of a stage, failures are recorded with the error and raised again
+        '''
+        current = Stage(name, rows_in)
+        profiler = self.start_profile()
+        error = None
+        start = time.perf_counter()
+        try:
+            yield current
+        except Exception as e:
+            error = repr(e)
+            raise
+        finally:
+            seconds = time.perf_counter() - start
+            if profiler is not None:
+                self.stop_profile(name, profiler)
+            self.record(current, seconds, error)
+
+    def summary(self):
+        '''
+        Totals per stage with their throughput in rows per second
+        '''
+        with self.lock:
+            summary = {name: dict(total) for name, total in self.totals.items()}
+        for total in summary.values():
+            rows = total['rows_in'] or total['rows_out']
+            total['seconds'] = round(total['seconds'], 4)
+            total['rows_per_second'] = round(rows / total['seconds']) if rows and total['seconds'] else None
+        return summary
+
+    def write(self, path=None):
+        '''
+        Writes the summary to a json file, data/metrics/metrics-<timestamp>.json by default
+        '''
+        path = path or os.path.join(METRICS_DIR, 'metrics-%s.json' % datetime.datetime.now().strftime('%Y%m%d%H%M%S'))
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        summary = self.summary()
+        output = {'date': datetime.datetime.now().isoformat(' ', 'seconds'), 'peak_rss_mb': peak_rss_mb(), 'stages': summary}
+        if self.profiles:
+            hottest = max(self.profiles, key=lambda name: summary[name]['seconds'])
+            output['profile'] = os.path.splitext(path)[0] + '-' + hottest + '.prof'
+            self.profiles[hottest].dump_stats(output['profile'])
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(output, f, indent=2)
+        print("Saved metrics to " + path)
+        return path
+
+    def reset(self):
+        with self.lock:
+            self.totals = {}
+            self.profiles = {}
+
+metrics = Metrics()
+stage = metrics.stage
+
+def timed(name, rows_out=len):
+    '''
+    Decorator recording every call of a function as a stage, rows_in is the length of the first argument
+    and rows_out(result) the number of rows it produced
+    '''
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            rows_in = len(args[0]) if args and hasattr(args[0], '__len__') else None
+            with metrics.stage(name, rows_in) as current:
+                result = function(*args, **kwargs)
+                current.rows_out = rows_out(result)
+                return result
+        return wrapper
+    return decorate
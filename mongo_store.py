@@ -0,0 +1,182 @@
+import datetime
+import itertools
+import logging
+import os
+import threading
+import time
+
+import pymongo
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
+
+from id_index import get_index
+
+DEFAULT_POOL_SIZE = 20
+DEFAULT_CURSOR_BATCH = 5000
+DUPLICATE_KEY = 11000
+
+logger = logging.getLogger(__name__)
+
+client = None
+client_lock = threading.Lock()
+indexed = set()
+
+def get_client(uri=None, pool_size=None):
+    '''
+    Returns the MongoClient shared by every thread of the process, created on first use
+    Its connection pool holds pool_size connections, mongo_pool_size in the environment or 20 by default
+    '''
+    global client
+    with client_lock:
+        if client is None:
+            pool_size = pool_size or int(os.environ.get('mongo_pool_size', DEFAULT_POOL_SIZE))
+            client = pymongo.MongoClient(uri or os.environ.get('mongo'), maxPoolSize=pool_size)
+        return client
+
+def get_collection(topic, db=None):
+    '''
+    Returns the collection of a topic, making sure once per process that it has a unique index on the tweet id
+    When the index cannot be created, typically because the collection already holds a tweet twice, the error is
+    logged and the index is tried again on the next call, remove_duplicates clears the duplicates and creates it
+    '''
+    db = db or os.environ.get('db')
+    coll = get_client()[db][topic]
+    if (db, topic) not in indexed:
+        try:
+            coll.create_index('id', unique=True)
+            indexed.add((db, topic))
+        except PyMongoError:
+            logger.exception("no unique index on id for %s.%s, tweets may be stored twice, run `cli.py dedup` to remove the duplicates", db, topic)
+    return coll
+
+def remove_duplicates(topic, db=None, batch_size=DEFAULT_CURSOR_BATCH):
+    '''
+    One-off cleanup of a collection written without its unique id index: keeps the first stored document of every
+    tweet id, deletes the others and creates the index, returns how many documents were deleted
+    '''
+    db = db or os.environ.get('db')
+    coll = get_client()[db][topic]
+    seen, duplicates = set(), []
+    for doc in coll.find({}, {'id': 1}, sort=[('_id', 1)], batch_size=batch_size):
+        if doc.get('id') in seen:
+            duplicates.append(doc['_id'])
+        else:
+            seen.add(doc.get('id'))
+    for i in range(0, len(duplicates), batch_size):
+        coll.delete_many({'_id': {'$in': duplicates[i:i+batch_size]}})
+    coll.create_index('id', unique=True)
+    indexed.add((db, topic))
+    print("removed %d duplicates from %s" % (len(duplicates), topic))
+    return len(duplicates)
+
+def upsert_tweets(coll, tweets, skipped_ids=None):
+    '''
+    Writes tweets as one unordered bulk of upserts keyed on id, returns how many were already stored
+    and appends their ids to skipped_ids when it is given
+    A tweet which is already stored is left as is without aborting the rest of the batch,
+    any other write error is raised once the rest of the batch is written
+    '''
+    if not tweets:
+        return 0
+    requests = [UpdateOne({'id': tweet['id']}, {'$setOnInsert': tweet}, upsert=True) for tweet in tweets]
+    try:
+        upserted = set(coll.bulk_write(requests, ordered=False).upserted_ids)
+    except BulkWriteError as e:
+        errors = [error for error in e.details['writeErrors'] if error['code'] != DUPLICATE_KEY]
+        if errors:
+            raise
+        upserted = {upsert['index'] for upsert in e.details['upserted']}
+    if skipped_ids is not None:
+        skipped_ids.extend(int(tweet['id']) for i, tweet in enumerate(tweets) if i not in upserted)
+    return len(tweets) - len(upserted)
+
+def save_tweets_mongo(tweets, topic, db=None, skipped_ids=None):
+    '''
+    Upserts tweets into the collection of a topic, the mongodb counterpart of save_tweets_csv
+    Tweets whose id is already stored are skipped, it returns how many were skipped
+    A failed write raises, so the caller does not move its checkpoint past the page
+    The ids of the skipped tweets are appended to skipped_ids when it is given
+    '''
+    coll = get_collection(topic, db)
+    index = get_index(topic, 'mongo', lambda: [doc['id'] for doc in coll.find({}, {'id': 1, '_id': 0})], coll.estimated_document_count)
+    with index.lock:
+        tweets, skipped = index.filter_new(tweets, skipped_ids)
+        if tweets:
+            skipped += upsert_tweets(coll, tweets, skipped_ids)
+            index.add(tweets)
+    print("done inserting, skipped %d duplicates" % skipped)
+    return skipped
+
+def id_bound(value):
+    '''
+    An _id bound from an ObjectId, or from a datetime as the first ObjectId generated at that time
+    '''
+    if isinstance(value, datetime.datetime):
+        return ObjectId.from_datetime(value)
+    return ObjectId(value) if isinstance(value, str) else value
+
+def iter_mongo_batches(topic, batch_size, columns=None, start=None, end=None, by='_id', db=None, cursor_batch=DEFAULT_CURSOR_BATCH):
+    '''
+    Streams the tweets of a topic from its collection as DataFrames of at most batch_size rows, in insertion order
+    Only columns are fetched, cursor_batch documents per round trip
+    start and end bound the window [start, end): by='_id' filters on the server by insertion time (ObjectId or datetime),
+    by='created_at' drops the tweets created outside the window from every chunk
+    '''
+    import pandas
+    from pipeline import parse_created_at, utc_timestamp
+    coll = get_collection(topic, db)
+    query = {}
+    if by == '_id' and (start is not None or end is not None):
+        query['_id'] = {}
+        if start is not None:
+            query['_id']['$gte'] = id_bound(start)
+        if end is not None:
+            query['_id']['$lt'] = id_bound(end)
+    projection = {column: 1 for column in columns} if columns else {}
+    projection['_id'] = 0
+    cursor = iter(coll.find(query, projection, sort=[('_id', 1)], batch_size=cursor_batch))
+    while True:
+        tweets = pandas.DataFrame.from_records(list(itertools.islice(cursor, batch_size)), columns=columns)
+        if tweets.empty:
+            return
+        if by == 'created_at' and (start is not None or end is not None):
+            created_at = parse_created_at(tweets['created_at'])
+            window = pandas.Series(True, index=tweets.index)
+            if start is not None:
+                window &= created_at >= utc_timestamp(start)
+            if end is not None:
+                window &= created_at < utc_timestamp(end)
+            tweets = tweets[window].reset_index(drop=True)
+        yield tweets
+
+def read_tweets_mongo(topic, columns=None, start=None, end=None, by='_id', db=None, batch_size=DEFAULT_CURSOR_BATCH):
+    '''
+    Loads the tweets of a topic straight from its collection into one DataFrame, see iter_mongo_batches
+    '''
+    import pandas
+    chunks = list(iter_mongo_batches(topic, batch_size, columns, start, end, by, db))
+    if not chunks:
+        return pandas.DataFrame(columns=columns)
+    return pandas.concat(chunks, ignore_index=True)
+
+def benchmark_mongo(coll, tweets, batch_sizes=(100, 1000, 10000)):
+    '''
+    Measures the upsert throughput of a collection for several batch sizes, against an empty collection
+    and again with every tweet already stored
+    '''
+    import pandas
+    rows = []
+    for batch_size in batch_sizes:
+        coll.delete_many({})
+        for run in ('new', 'duplicate'):
+            skipped = 0
+            start = time.perf_counter()
+            for i in range(0, len(tweets), batch_size):
+                skipped += upsert_tweets(coll, tweets[i:i+batch_size])
+            seconds = time.perf_counter() - start
+            rows.append({'batch_size': batch_size, 'run': run, 'tweets': len(tweets), 'skipped': skipped,
+                         'seconds': round(seconds, 4), 'tweets_per_second': round(len(tweets) / seconds)})
+    benchmark = pandas.DataFrame(rows)
+    print(benchmark)
+    return benchmark
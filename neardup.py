@@ -0,0 +1,194 @@
+import os
+import zlib
+
+import numpy as np
+import pandas
+
+DEFAULT_THRESHOLD = 0.8
+DEFAULT_NUM_PERM = 128
+DEFAULT_SHINGLE_SIZE = 5
+SEED = 1
+HASH_CHUNK = 100
+
+def shingles(text, size=DEFAULT_SHINGLE_SIZE):
+    '''
+    Character shingles of a cleaned tweet, lowercased with the whitespace collapsed
+    '''
+    text = ' '.join(text.lower().split())
+    if len(text) <= size:
+        return {text}
+    return {text[i:i+size] for i in range(len(text) - size + 1)}
+
+def lsh_params(threshold, num_perm=DEFAULT_NUM_PERM):
+    '''
+    Number of bands and rows per band (bands*rows <= num_perm) whose S-curve threshold (1/bands)**(1/rows) is closest to threshold
+    '''
+    return min(((bands, num_perm // bands) for bands in range(1, num_perm + 1)),
+               key=lambda params: abs((1 / params[0]) ** (1 / params[1]) - threshold))
+
+def permutations(num_perm=DEFAULT_NUM_PERM, seed=SEED):
+    '''
+    The odd a and the b of the num_perm multiply-shift hash functions (a*x + b) >> 32 over 64 bits,
+    fixed by the seed so signatures can be stored
+    '''
+    rng = np.random.RandomState(seed)
+    return (rng.randint(0, 2**64, size=num_perm, dtype=np.uint64) | np.uint64(1), rng.randint(0, 2**64, size=num_perm, dtype=np.uint64))
+
+def minhash(texts, num_perm=DEFAULT_NUM_PERM, shingle_size=DEFAULT_SHINGLE_SIZE, seed=SEED):
+    '''
+    MinHash signatures of the texts, one row of num_perm uint32 values per text
+    The crc32 of every shingle goes through all hash functions at once, HASH_CHUNK texts at a time
+    '''
+    a, b = permutations(num_perm, seed)
+    texts = list(texts)
+    signatures = np.empty((len(texts), num_perm), dtype=np.uint32)
+    for start in range(0, len(texts), HASH_CHUNK):
+        hashes = [[zlib.crc32(shingle.encode('utf-8')) for shingle in shingles(text, shingle_size)] for text in texts[start:start+HASH_CHUNK]]
+        offsets = np.cumsum([0] + [len(values) for values in hashes[:-1]])
+        values = np.fromiter((value for values in hashes for value in values), dtype=np.uint64)
+        products = np.multiply(values[:, None], a)
+        products += b
+        products >>= np.uint64(32)
+        signatures[start:start+len(hashes)] = np.minimum.reduceat(products, offsets, axis=0)
+    return signatures
+
+class NearDuplicateIndex:
+    '''
+    MinHash/LSH index of the tweets kept so far: their signatures and the hash of every band of rows
+    Tweets sharing a band with another are candidates, they are near duplicates when the share of equal
+    signature values (the estimated Jaccard similarity of their shingles) reaches threshold
+    New batches are only compared with the stored signatures, the older tweets are never hashed again
+    '''
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD, num_perm=DEFAULT_NUM_PERM, shingle_size=DEFAULT_SHINGLE_SIZE, seed=SEED):
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.seed = seed
+        self.bands, self.rows = lsh_params(threshold, num_perm)
+        # random multipliers folding the rows of a band into one uint64
+        self.band_weights = np.random.RandomState(seed + 1).randint(1, 2**63, size=self.rows, dtype=np.uint64) | np.uint64(1)
+        self.signatures = np.empty((0, num_perm), dtype=np.uint32)
+        self.band_hashes = np.empty((0, self.bands), dtype=np.uint64)
+        self.sorted = None
+
+    def __len__(self):
+        return len(self.signatures)
+
+    def params(self):
+        return np.array([self.threshold, self.num_perm, self.shingle_size, self.seed], dtype=np.float64)
+
+    def hash_bands(self, signatures):
+        bands = signatures[:, :self.bands * self.rows].reshape(len(signatures), self.bands, self.rows)
+        return (bands.astype(np.uint64) * self.band_weights).sum(axis=2, dtype=np.uint64)
+
+    def band_index(self):
+        '''
+        Per band the stored band hashes sorted, with the rows they belong to, built once and after every add
+        '''
+        if self.sorted is None:
+            order = np.argsort(self.band_hashes, axis=0, kind='stable')
+            self.sorted = (order, np.take_along_axis(self.band_hashes, order, axis=0))
+        return self.sorted
+
+    def similar(self, signature, rows, signatures):
+        return bool(((signatures[rows] == signature).mean(axis=1) >= self.threshold).any())
+
+    def find(self, signatures, created_at=None):
+        '''
+        Returns the mask of the rows that are near duplicates, of a stored tweet or of an earlier row of the batch
+        Within the batch the tweets are clustered and the earliest of each cluster (by created_at, then position) is kept
+        '''
+        n = len(signatures)
+        band_hashes = self.hash_bands(signatures)
+        duplicate = np.zeros(n, dtype=bool)
+        if len(self):
+            order, hashes = self.band_index()
+            for band in range(self.bands):
+                left = np.searchsorted(hashes[:, band], band_hashes[:, band], 'left')
+                right = np.searchsorted(hashes[:, band], band_hashes[:, band], 'right')
+                for i in np.flatnonzero((right > left) & ~duplicate):
+                    duplicate[i] = self.similar(signatures[i], order[left[i]:right[i], band], self.signatures)
+
+        # union-find over the candidate pairs of the batch that are similar enough, every member of a bucket
+        # is compared at once with one representative per cluster met in the bucket, not with every earlier member
+        parent = np.arange(n)
+        def root(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+        candidates = np.flatnonzero(~duplicate)
+        for band in range(self.bands):
+            order = np.argsort(band_hashes[candidates, band], kind='stable')
+            hashes = band_hashes[candidates[order], band]
+            starts = np.flatnonzero(np.r_[True, hashes[1:] != hashes[:-1]])
+            ends = np.r_[starts[1:], len(hashes)]
+            shared = ends - starts > 1
+            for start, end in zip(starts[shared], ends[shared]):
+                group = candidates[order[start:end]]
+                reps = [group[0]]
+                for i in group[1:]:
+                    matched = [reps[k] for k in np.flatnonzero((signatures[reps] == signatures[i]).mean(axis=1) >= self.threshold)]
+                    if not matched:
+                        reps.append(i)
+                        continue
+                    for j in matched:
+                        if root(i) != root(j):
+                            parent[root(i)] = root(j)
+                    if len(matched) > 1:
+                        # the clusters i bridges are one now, keep a single representative of them
+                        reps = [j for j in reps if j not in matched[1:]]
+
+        if created_at is None:
+            rank = np.arange(n)
+        else:
+            rank = np.lexsort((np.arange(n), pandas.DatetimeIndex(pandas.to_datetime(created_at, utc=True)).asi8)).argsort()
+        roots = np.array([root(i) for i in range(n)], dtype=np.int64)
+        earliest = {}
+        for i in candidates[np.argsort(rank[candidates], kind='stable')]:
+            earliest.setdefault(roots[i], i)
+        keep = np.zeros(n, dtype=bool)
+        keep[list(earliest.values())] = True
+        return duplicate | ~keep
+
+    def add(self, signatures):
+        self.signatures = np.concatenate([self.signatures, signatures])
+        self.band_hashes = np.concatenate([self.band_hashes, self.hash_bands(signatures)])
+        self.sorted = None
+
+    def dedup(self, texts, created_at=None):
+        '''
+        Hashes a batch of cleaned tweets, adds the ones that are not near duplicates to the index
+        and returns their mask
+        '''
+        signatures = minhash(texts, self.num_perm, self.shingle_size, self.seed)
+        keep = ~self.find(signatures, created_at)
+        self.add(signatures[keep])
+        return keep
+
+    def save(self, path, offset=None):
+        '''
+        Writes the signatures and band hashes to a .npz file, offset records the watermark they were built up to
+        '''
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path+'.tmp', 'wb') as f:
+            np.savez(f, params=self.params(), offset=np.array([-1 if offset is None else offset]),
+                     signatures=self.signatures, band_hashes=self.band_hashes)
+        os.replace(path+'.tmp', path)
+
+    @classmethod
+    def load(cls, path, threshold=DEFAULT_THRESHOLD, num_perm=DEFAULT_NUM_PERM, shingle_size=DEFAULT_SHINGLE_SIZE, seed=SEED, offset=None):
+        '''
+        Loads a saved index, None when there is none with these parameters and watermark
+        '''
+        if not os.path.exists(path):
+            return None
+        index = cls(threshold, num_perm, shingle_size, seed)
+        with np.load(path) as data:
+            if not np.array_equal(data['params'], index.params()) or int(data['offset'][0]) != (-1 if offset is None else offset):
+                return None
+            index.signatures = data['signatures']
+            index.band_hashes = data['band_hashes']
+        return index
@@ -0,0 +1,286 @@
+import hashlib
+import io
+import os
+from collections import Counter
+
+import numpy as np
+import pandas
+from cleaning import clean_column
+from geo import resolve_states, state_codes
+from scoring import score_polarity, scoring_pool, get_sentiment, DEFAULT_CHUNK_SIZE, ANALYZER_VERSION as TEXTBLOB_VERSION
+from lexicon import lexicon_polarity, ANALYZER_NAME as LEXICON_ANALYZER, ANALYZER_VERSION as LEXICON_VERSION
+from wordfreq import count_words
+from rollup import new_cube, rollup_cells, merge_cube, state_counts
+from neardup import NearDuplicateIndex
+from id_index import TweetIdIndex
+from metrics import stage, timed
+
+DEFAULT_BATCH_SIZE = 10000
+RECORD_SCAN_SIZE = 2**24
+CREATED_AT_FORMAT = '%a %b %d %H:%M:%S %z %Y'
+SENTIMENTS = ['Positive', 'Negative', 'Neutral']
+
+def remove_punctuations(text):
+    '''
+    This method is used to clean the tweets
+    '''
+    punct =['%','/',':','\\','&amp;','&',';']
+    for punctuation in punct:
+        text = text.replace(punctuation, '')
+    return text
+
+def get_value_counts(col_name, analyzer_name, tweets_df):
+    '''
+    This function returns count of the dataset passed, it uses pands library to do the same
+    '''
+    return counts_table(tweets_df[col_name].value_counts(), analyzer_name)
+
+def counts_table(value_counts, analyzer_name):
+    '''
+    Builds the sentiment/counts/percentage table of get_value_counts from a Series or dict of counts per sentiment
+    '''
+    value_counts = pandas.Series(value_counts, dtype='int64')
+    value_counts = value_counts[value_counts > 0].sort_values(ascending=False)
+    count = pandas.DataFrame(value_counts)
+    percentage = pandas.DataFrame(value_counts.div(value_counts.sum()).mul(100))
+    counts = pandas.concat([count, percentage], axis = 1)
+    counts = counts.reset_index()
+    counts.columns = ['sentiment', 'counts', 'percentage']
+    counts.sort_values('sentiment', inplace = True)
+    counts['percentage'] = counts['percentage'].apply(lambda x: round(x,2))
+    counts = counts.reset_index(drop = True)
+    counts['analyzer'] = analyzer_name
+    return counts
+
+def clean_tweets(result, near_duplicates=None):
+    '''
+    Cleans the tweets of a topic, drops duplicates and tweets left without any text
+    With a near_duplicates similarity threshold (0 to 1) tweets whose shingles are about that similar to another's
+    are dropped as well, keeping the earliest of each cluster
+    '''
+    with stage('clean', len(result)) as current:
+        keys, cleaned, blank = clean_column(result['tweet'])
+        current.rows_out = len(result)
+
+    # keep the first tweet per p.clean'ed text, then drop tweets which have empty text field
+    with stage('dedup', len(result)) as current:
+        keep = ~keys.duplicated() & ~blank
+        result_copy = result[keep].copy()
+        result_copy['tweet_cleaned'] = cleaned[keep]
+        current.rows_out = len(result_copy)
+
+    if near_duplicates:
+        with stage('near_dedup', len(result_copy)) as current:
+            created_at = parse_created_at(result_copy['created_at']) if 'created_at' in result_copy else None
+            result_copy = result_copy[NearDuplicateIndex(near_duplicates).dedup(result_copy['tweet_cleaned'], created_at)]
+            current.rows_out = len(result_copy)
+
+    return result_copy.reset_index(drop=True)
+
+def analyzer_version(analyzer):
+    '''
+    Version string of an analyzer, scores of different versions are never mixed
+    '''
+    return LEXICON_VERSION if analyzer == LEXICON_ANALYZER else TEXTBLOB_VERSION
+
+@timed('score')
+def score_tweets(tweets, analyzer='TextBlob', workers=None, chunk_size=DEFAULT_CHUNK_SIZE, cache=None, executor=None):
+    '''
+    Returns the polarity scores of the cleaned tweets for the selected analyzer, 'TextBlob' or 'Lexicon'
+    With a ScoreCache only the tweets missing from the cache are scored, executor is a pool from scoring_pool
+    '''
+    if analyzer == LEXICON_ANALYZER:
+        scorer = lexicon_polarity
+    else:
+        scorer = lambda x: score_polarity(x, workers=workers, chunk_size=chunk_size, executor=executor)
+    if cache is None:
+        return scorer(tweets)
+    return cache.score(tweets, analyzer_version(analyzer), scorer)
+
+class FileRange(io.RawIOBase):
+    '''
+    Read-only view of the bytes between two offsets of an open binary file
+    '''
+
+    def __init__(self, f, offset, end):
+        f.seek(offset)
+        self.f = f
+        self.remaining = end - offset
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        data = self.f.read(min(len(b), self.remaining))
+        self.remaining -= len(data)
+        b[:len(data)] = data
+        return len(data)
+
+def record_end(file, offset=0, end=None):
+    '''
+    Byte offset just after the last complete csv record between offset (a record boundary) and end, offset when there is none
+    Records end at a newline outside double quotes, so tweets with line breaks are not cut and a row which
+    the fetch writer is still appending is left for the next run
+    '''
+    if end is None:
+        end = os.stat(file).st_size
+    last = offset
+    quoted = 0
+    with open(file, 'rb') as f:
+        f.seek(offset)
+        position = offset
+        while position < end:
+            data = np.frombuffer(f.read(min(RECORD_SCAN_SIZE, end - position)), dtype=np.uint8)
+            if not len(data):
+                break
+            inside = (np.cumsum(data == ord('"')) + quoted) % 2
+            newlines = np.flatnonzero((data == ord('\n')) & (inside == 0))
+            if len(newlines):
+                last = position + int(newlines[-1]) + 1
+            quoted = int(inside[-1])
+            position += len(data)
+    return last
+
+def iter_batches(file, batch_size=DEFAULT_BATCH_SIZE, offset=0, end=None, columns=None):
+    '''
+    Yields the rows of a csv file between the byte offsets offset and end as DataFrames of at most batch_size rows
+    Rows after the start of the file are parsed with the given column names
+    '''
+    if end is None:
+        end = os.stat(file).st_size
+    with open(file, 'rb') as f:
+        reader = io.BufferedReader(FileRange(f, offset, end))
+        if offset > 0 and not reader.peek(1).strip():
+            return
+        options = {} if offset == 0 else {'header': None, 'names': columns}
+        for batch in pandas.read_csv(reader, chunksize=batch_size, **options):
+            yield batch
+
+def dedup_key(text):
+    '''
+    Compact key of a p.clean'ed tweet, used instead of the text itself in the dedup set: 64 bits of its hash as a signed int
+    '''
+    return int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'little', signed=True)
+
+def new_aggregate(near_duplicates=None):
+    return {'seen': TweetIdIndex(None), 'counts': {}, 'states': {}, 'words': Counter(), 'cube': new_cube(),
+            'near_index': NearDuplicateIndex(near_duplicates) if near_duplicates else None}
+
+def aggregate_batch(state, tweets, analyzer='TextBlob', workers=None, chunk_size=DEFAULT_CHUNK_SIZE, cache=None, executor=None):
+    '''
+    Merges a batch of raw tweets into the running aggregate: dedup key set, sentiment counts, state tallies,
+    word frequencies and the hourly rollup cube
+    Feeding a file batch by batch produces the same tallies as cleaning, deduplicating and scoring it at once
+    With a near duplicate index the tweets near a tweet of an earlier batch are dropped, within a batch the earliest
+    of each cluster is kept. Pass the executor of a scoring_pool when feeding many batches
+    '''
+    seen = state['seen']
+    with stage('clean', len(tweets)) as current:
+        keys, cleaned, blank = clean_column(tweets['tweet'])
+        current.rows_out = len(tweets)
+    with stage('dedup', len(tweets)) as current:
+        keys = keys.apply(dedup_key).astype('int64')
+        new = ~keys.duplicated() & ~pandas.Series(seen.contains(keys.to_numpy()), index=keys.index)
+        seen.add_ids(keys[new].to_numpy())
+
+        batch = tweets[new & ~blank].copy()
+        batch['tweet_cleaned'] = cleaned[new & ~blank]
+        current.rows_out = len(batch)
+    if state.get('near_index') is not None and len(batch):
+        with stage('near_dedup', len(batch)) as current:
+            batch = batch[state['near_index'].dedup(batch['tweet_cleaned'], parse_created_at(batch['created_at']))]
+            current.rows_out = len(batch)
+    if len(batch) == 0:
+        return state
+
+    scores = score_tweets(batch['tweet_cleaned'], analyzer, workers, chunk_size, cache, executor)
+    sentiments = [get_sentiment(c) for c in scores]
+    count_words(batch['tweet_cleaned'], state['words'])
+    codes, _ = resolve_states(batch['location'])
+    state['cube'] = merge_cube(state['cube'], rollup_cells(batch['created_at'], codes, sentiments, scores))
+    for code, sentiment in zip(codes, sentiments):
+        state['counts'][sentiment] = state['counts'].get(sentiment, 0) + 1
+        if isinstance(code, str):
+            tally = state['states'].setdefault(code, {})
+            tally[sentiment] = tally.get(sentiment, 0) + 1
+    return state
+
+def stream_report(batches, analyzer='TextBlob', workers=None, chunk_size=DEFAULT_CHUNK_SIZE, cache=None, near_duplicates=None):
+    '''
+    Aggregates an iterable of tweet DataFrames batch by batch, such as iter_batches(file) of a csv file
+    Peak memory is bounded by the batch size and the dedup key set, one scoring pool serves every batch
+    '''
+    aggregate = new_aggregate(near_duplicates)
+    with scoring_pool(workers) as executor:
+        for tweets in batches:
+            aggregate = aggregate_batch(aggregate, tweets, analyzer, workers, chunk_size, cache, executor)
+    return aggregate
+
+def parse_created_at(created_at):
+    '''
+    Parses Twitter's created_at strings ("Wed May 05 23:07:01 +0000 2021") into UTC datetimes
+    '''
+    if pandas.api.types.is_datetime64_any_dtype(created_at):
+        return created_at
+    return pandas.to_datetime(created_at, format=CREATED_AT_FORMAT, utc=True)
+
+def utc_timestamp(value):
+    '''
+    A window bound as a UTC Timestamp, times without a timezone are taken as UTC and the others converted
+    '''
+    value = pandas.Timestamp(value)
+    return value.tz_localize('UTC') if value.tzinfo is None else value.tz_convert('UTC')
+
+def sentiment_table(data, analyzer_name, start=None, end=None):
+    '''
+    The bar table of counts_table for one topic, data is its scored DataFrame or its streaming/incremental aggregate
+    start and end restrict it to the tweets created in [start, end), aggregates are windowed with their rollup cube
+    to the hours starting in [start, end)
+    '''
+    from rollup import sentiment_counts
+    if isinstance(data, dict):
+        return counts_table(data['counts'] if start is None and end is None else sentiment_counts(data['cube'], start, end), analyzer_name)
+    created_at = data['created_at']
+    window = pandas.Series(True, index=data.index)
+    if start is not None:
+        window &= created_at >= utc_timestamp(start)
+    if end is not None:
+        window &= created_at < utc_timestamp(end)
+    return get_value_counts('textblob_sentiment', analyzer_name, data[window])
+
+def state_sentiment_table(results, start=None, end=None):
+    '''
+    Counts tweets per US state and sentiment for every topic in one tidy table, reindexed to all state codes
+    results maps a topic to its scored DataFrame, or to a streaming/incremental aggregate with state tallies
+    start and end restrict scored DataFrames to tweets created in [start, end), aggregates are windowed with
+    their rollup cube to the hours starting in [start, end)
+    '''
+    tables = []
+    for topic, data in results.items():
+        if isinstance(data, dict):
+            states = data['states'] if start is None and end is None else state_counts(data['cube'], start, end)
+            counts = pandas.DataFrame.from_dict(states, orient='index')
+        else:
+            if start is not None or end is not None:
+                created_at = parse_created_at(data['created_at'])
+                window = pandas.Series(True, index=data.index)
+                if start is not None:
+                    window &= created_at >= utc_timestamp(start)
+                if end is not None:
+                    window &= created_at < utc_timestamp(end)
+                data = data[window]
+            codes = data['us_state_code'] if 'us_state_code' in data else resolve_states(data['location'])[0]
+            counts = pandas.crosstab(codes, data['textblob_sentiment'])
+        counts = counts.reindex(index=state_codes, columns=SENTIMENTS).fillna(0).astype('int64')
+        counts.index.name = 'State'
+        counts.columns.name = None
+        counts = counts.reset_index()
+        counts.insert(0, 'topic', topic)
+        tables.append(counts)
+
+    table = pandas.concat(tables, ignore_index=True)
+    table['Total'] = table[SENTIMENTS].sum(axis=1)
+    for sentiment in ['Positive', 'Negative']:
+        percentage = (table[sentiment] / table['Total'].where(table['Total'] > 0) * 100).fillna(0)
+        table[sentiment+'Percentage'] = percentage.apply(lambda x: round(x,2))
+    return table
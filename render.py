@@ -0,0 +1,116 @@
+import glob
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas
+
+RENDER_DIR = os.path.join('data', 'charts')
+RENDER_VERSION = 1
+MATPLOTLIB_FORMATS = ('png', 'svg')
+PLOTLY_FORMATS = ('html', 'json')
+
+def draw_bars(final_bar, topics):
+    '''
+    Bar graph of the sentiment percentages, one subplot per topic with the percentage written over every bar
+    '''
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    fig = plt.figure()
+    fig.subplots_adjust(hspace=0.8, wspace=0.8)
+    for i, (topic, table) in enumerate(zip(topics, final_bar)):
+        ax = fig.add_subplot(2, 2, i + 1)
+        ax.set_title(topic)
+        for index, row in table.iterrows():
+            ax.text(row.name, row.percentage, round(row.percentage, 1), color='black', ha="center")
+        sns.barplot(x="sentiment", y="percentage", data=table, ax=ax)
+    return fig
+
+def draw_wordcloud(word_counts):
+    '''
+    Word cloud of the word frequencies of a topic
+    '''
+    from wordcloud import WordCloud
+    return WordCloud(width = 800, height = 800, background_color ='black', min_font_size = 10).generate_from_frequencies(word_counts)
+
+def draw_map(state_df, topic):
+    '''
+    Choropleth of the positive percentage per US state of a topic
+    '''
+    import plotly.express as px
+    return px.choropleth(state_df, locations='State', locationmode='USA-states',
+            scope='usa', color = 'PositivePercentage', hover_name='State', hover_data=['Positive','Negative','Neutral'], range_color= [10,90], color_continuous_scale= 'armyrose', title='Covid-19 Vaccine Sentiment ' + topic )
+
+def save_bars(path, formats, final_bar, topics):
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    fig = draw_bars(final_bar, topics)
+    for fmt in formats:
+        fig.savefig(path + '.' + fmt, format=fmt)
+    plt.close(fig)
+
+def save_wordcloud(path, formats, word_counts):
+    wordcloud = draw_wordcloud(word_counts)
+    for fmt in formats:
+        if fmt == 'svg':
+            with open(path + '.svg', 'w', encoding='utf-8') as f:
+                f.write(wordcloud.to_svg())
+        else:
+            wordcloud.to_file(path + '.' + fmt)
+
+def save_map(path, formats, state_df, topic):
+    fig = draw_map(state_df, topic)
+    for fmt in formats:
+        if fmt == 'html':
+            fig.write_html(path + '.html', include_plotlyjs='cdn')
+        elif fmt == 'json':
+            fig.write_json(path + '.json')
+        else:
+            fig.write_image(path + '.' + fmt)
+
+def input_hash(*data):
+    '''
+    Hash of the tables and values a chart is drawn from, DataFrames are hashed by their values, index and columns
+    '''
+    digest = hashlib.blake2b(digest_size=8)
+    digest.update(str(RENDER_VERSION).encode('utf-8'))
+    for value in data:
+        if isinstance(value, (list, tuple)):
+            digest.update(input_hash(*value).encode('utf-8'))
+        elif isinstance(value, pandas.DataFrame):
+            digest.update(json.dumps(list(map(str, value.columns))).encode('utf-8'))
+            digest.update(pandas.util.hash_pandas_object(value, index=True).values.tobytes())
+        elif isinstance(value, dict):
+            digest.update(json.dumps(sorted(value.items()), default=str).encode('utf-8'))
+        else:
+            digest.update(json.dumps(value, default=str).encode('utf-8'))
+    return digest.hexdigest()
+
+def render_charts(charts, output_dir=RENDER_DIR, workers=None):
+    '''
+    Writes charts to files in parallel processes, charts is a list of (name, save function, formats, args)
+    Every output is named <name>-<hash of args>.<format>, a chart whose files exist already is not drawn again
+    and the files of the previous version of a chart are removed. Returns {name: [paths]}
+    '''
+    os.makedirs(output_dir, exist_ok=True)
+    outputs = {}
+    pending = []
+    for name, save, formats, args in charts:
+        path = os.path.join(output_dir, name + '-' + input_hash(name, list(formats), *args))
+        outputs[name] = [path + '.' + fmt for fmt in formats]
+        if not all(os.path.exists(output) for output in outputs[name]):
+            pending.append((name, save, path, formats, args))
+    if pending:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(save, path, formats, *args) for name, save, path, formats, args in pending]
+            for future in futures:
+                future.result()
+    for name in outputs:
+        # older versions of the chart, the hash is the only part of the file name after the chart's name
+        for stale in glob.glob(os.path.join(glob.escape(output_dir), glob.escape(name) + '-*')):
+            if stale not in outputs[name] and '-' not in os.path.basename(stale)[len(name)+1:]:
+                os.remove(stale)
+    print("Rendered %d of %d charts to %s" % (len(pending), len(charts), output_dir))
+    return outputs
@@ -0,0 +1,114 @@
+import os
+
+import pandas
+
+ROLLUP_DIR = os.path.join('data', 'rollup')
+ROLLUP_VERSION = '1'
+BUCKETS = {'hour': pandas.Timedelta(hours=1), 'day': pandas.Timedelta(days=1)}
+DIMENSIONS = ['bucket', 'state', 'sentiment']
+MEASURES = ['count', 'polarity']
+
+def new_cube():
+    '''
+    Empty rollup cube: tweet count and polarity sum per hour bucket (UTC), US state code ('' outside the US) and sentiment
+    '''
+    return pandas.DataFrame({'bucket': pandas.Series(dtype='datetime64[ns, UTC]'), 'state': pandas.Series(dtype=object),
+                             'sentiment': pandas.Series(dtype=object), 'count': pandas.Series(dtype='int64'),
+                             'polarity': pandas.Series(dtype='float64')})
+
+def rollup_cells(created_at, codes, sentiments, scores):
+    '''
+    Rolls scored tweets up to cube cells, created_at is parsed to UTC and floored to the hour
+    '''
+    from pipeline import parse_created_at
+    cells = pandas.DataFrame({'bucket': parse_created_at(pandas.Series(created_at)).dt.floor(BUCKETS['hour']).to_numpy(),
+                              'state': pandas.Series(codes, dtype=object).fillna('').to_numpy(),
+                              'sentiment': list(sentiments), 'count': 1, 'polarity': list(scores)})
+    return cells.groupby(DIMENSIONS, as_index=False, sort=False)[MEASURES].sum()
+
+def merge_cube(cube, cells):
+    '''
+    Adds cells to the cube, cells of the same bucket, state and sentiment are summed
+    '''
+    if len(cells) == 0:
+        return cube
+    if len(cube) == 0:
+        return cells.reset_index(drop=True)
+    return pandas.concat([cube, cells], ignore_index=True).groupby(DIMENSIONS, as_index=False, sort=False)[MEASURES].sum()
+
+def cube_path(topic):
+    return os.path.join(ROLLUP_DIR, topic+'.parquet')
+
+def load_cube(topic, analyzer, offset):
+    '''
+    Returns the persisted cube of a topic, None when there is none for this analyzer or it was not saved
+    with the incremental state at byte offset `offset`
+    '''
+    import pyarrow.parquet as pq
+    path = cube_path(topic)
+    if not os.path.exists(path):
+        return None
+    table = pq.read_table(path)
+    metadata = table.schema.metadata or {}
+    if (metadata.get(b'version') != ROLLUP_VERSION.encode() or metadata.get(b'analyzer') != str(analyzer).encode()
+            or metadata.get(b'offset') != str(offset).encode()):
+        return None
+    return table.to_pandas()
+
+def save_cube(topic, cube, analyzer, offset):
+    '''
+    Writes the cube of a topic to data/rollup/<topic>.parquet, tagged with the state's byte offset and analyzer
+    '''
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    os.makedirs(ROLLUP_DIR, exist_ok=True)
+    path = cube_path(topic)
+    table = pa.Table.from_pandas(cube, preserve_index=False)
+    table = table.replace_schema_metadata(dict(table.schema.metadata or {}, version=ROLLUP_VERSION, analyzer=str(analyzer), offset=str(offset)))
+    pq.write_table(table, path+'.tmp')
+    os.replace(path+'.tmp', path)
+
+def cube_window(cube, start=None, end=None):
+    '''
+    Cells of the hour buckets starting in [start, end), times without a timezone are taken as UTC
+    '''
+    from pipeline import utc_timestamp
+    keep = pandas.Series(True, index=cube.index)
+    for bound, compare in ((start, cube['bucket'].ge), (end, cube['bucket'].lt)):
+        if bound is not None:
+            keep &= compare(utc_timestamp(bound))
+    return cube[keep]
+
+def sentiment_counts(cube, start=None, end=None):
+    '''
+    Tweets per sentiment in the window, the counts counts_table turns into the report's bar table
+    '''
+    counts = cube_window(cube, start, end).groupby('sentiment')['count'].sum()
+    return {sentiment: int(count) for sentiment, count in counts.items()}
+
+def state_counts(cube, start=None, end=None):
+    '''
+    Tweets per US state and sentiment in the window, shaped like the 'states' tallies of the streaming aggregates
+    '''
+    cells = cube_window(cube, start, end)
+    cells = cells[cells['state'] != ''].groupby(['state', 'sentiment'])['count'].sum()
+    states = {}
+    for (code, sentiment), count in cells.items():
+        states.setdefault(code, {})[sentiment] = int(count)
+    return states
+
+def trend(cube, bucket='hour', start=None, end=None, state=None):
+    '''
+    Tweets per sentiment, total and mean polarity for every hour or day bucket of the window, optionally of one US state
+    '''
+    from pipeline import SENTIMENTS
+    cells = cube_window(cube, start, end)
+    if state is not None:
+        cells = cells[cells['state'] == state]
+    buckets = cells['bucket'].dt.floor(BUCKETS[bucket])
+    table = cells.groupby([buckets, 'sentiment'])['count'].sum().unstack(fill_value=0)
+    table = table.reindex(columns=SENTIMENTS, fill_value=0).astype('int64')
+    table.columns.name = None
+    table['Total'] = table[SENTIMENTS].sum(axis=1)
+    table['polarity'] = (cells.groupby(buckets)['polarity'].sum() / table['Total']).round(4)
+    return table
@@ -0,0 +1,99 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import twitter
+
+from metrics import stage
+
+# standard search API with app auth: 450 requests per 15 minute window
+SEARCH_RATE_LIMIT = 450
+SEARCH_RATE_WINDOW = 15 * 60
+MAX_RETRIES = 5
+MAX_BACKOFF = SEARCH_RATE_WINDOW
+
+logger = logging.getLogger(__name__)
+
+class TokenBucket:
+    '''
+    Thread-safe token bucket allowing `rate` calls per `per` seconds with bursts up to `capacity`
+    '''
+
+    def __init__(self, rate=SEARCH_RATE_LIMIT, per=SEARCH_RATE_WINDOW, capacity=None):
+        self.fill_rate = rate / float(per)
+        self.capacity = capacity if capacity is not None else rate
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        '''
+        Blocks until a call is allowed
+        '''
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.fill_rate)
+                self.updated = now
+                if now >= self.paused_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = max(self.paused_until - now, (1 - self.tokens) / self.fill_rate)
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        '''
+        Holds every caller back for `seconds`, used when the API reports the window is exhausted
+        '''
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.tokens = 0.0
+
+def rate_limit_wait(error, attempt):
+    '''
+    Seconds to wait after a rate-limit error, from the x-rate-limit-reset header or an exponential backoff
+    '''
+    reset = error.e.headers.get('x-rate-limit-reset') if error.e.headers else None
+    if reset:
+        return min(max(float(reset) - time.time(), 1.0), MAX_BACKOFF)
+    return min(2 ** attempt, MAX_BACKOFF)
+
+def search_page(api, limiter=None, **params):
+    '''
+    Calls api.search.tweets through the shared limiter, backing off and retrying on rate-limit errors (429)
+    '''
+    with stage('fetch_page') as current:
+        for attempt in range(MAX_RETRIES + 1):
+            if limiter is not None:
+                limiter.acquire()
+            current.api_calls += 1
+            try:
+                result = api.search.tweets(**params)
+                current.rows_out = len(result['statuses'])
+                return result
+            except twitter.TwitterHTTPError as e:
+                if e.e.code != 429 or attempt == MAX_RETRIES:
+                    raise
+                wait = rate_limit_wait(e, attempt)
+                print("Rate limited, retrying in %.1f seconds" % wait)
+                if limiter is not None:
+                    limiter.pause(wait)
+                else:
+                    time.sleep(wait)
+
+def run_queries(jobs, query, workers=4):
+    '''
+    Runs independent query chains concurrently on a thread pool
+    jobs is a list of argument tuples for query, returns {job: result} and prints the jobs that failed
+    '''
+    results = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(query, *job): job for job in jobs}
+        for future, job in futures.items():
+            try:
+                results[job] = future.result()
+            except Exception as e:
+                logger.exception(e)
+    return results
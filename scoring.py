@@ -0,0 +1,56 @@
+import contextlib
+import os
+from concurrent.futures import ProcessPoolExecutor
+from importlib.metadata import version
+
+DEFAULT_CHUNK_SIZE = 2000
+ANALYZER_VERSION = 'TextBlob-' + version('textblob')
+
+def textblob_polarity(texts):
+    '''
+    Scores a list of cleaned tweets with TextBlob, one chunk per worker call
+    '''
+    from textblob import TextBlob
+    return [TextBlob(text).sentiment.polarity for text in texts]
+
+def get_sentiment(score, threshold=0.1):
+    '''
+    Converts a polarity score into the Positive/Neutral/Negative sentiment categories
+    '''
+    return 'Positive' if score >= threshold else ('Negative' if score <= -(threshold) else 'Neutral')
+
+@contextlib.contextmanager
+def scoring_pool(workers=None):
+    '''
+    Process pool shared by the score_polarity calls of a whole run, its workers import TextBlob and load
+    its lexicon once instead of once per batch. Yields None when workers=1
+    '''
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 1:
+        yield None
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        yield executor
+
+def score_polarity(tweets, workers=None, chunk_size=DEFAULT_CHUNK_SIZE, executor=None):
+    '''
+    Scores a Series or iterable of cleaned tweets in chunks across a process pool
+    It returns the polarity scores in the same order as the input, identical to calling TextBlob on every tweet
+    workers=None uses every core, workers=1 scores in the current process
+    executor is a pool from scoring_pool to use instead of starting one for this call
+    '''
+    texts = list(tweets)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    chunks = [texts[i:i + chunk_size] for i in range(0, len(texts), chunk_size)]
+    if workers <= 1 or len(chunks) <= 1:
+        return [score for chunk in chunks for score in textblob_polarity(chunk)]
+    if executor is not None:
+        return [score for chunk_scores in executor.map(textblob_polarity, chunks) for score in chunk_scores]
+
+    scores = []
+    with ProcessPoolExecutor(max_workers=min(workers, len(chunks))) as executor:
+        for chunk_scores in executor.map(textblob_polarity, chunks):
+            scores.extend(chunk_scores)
+    return scores
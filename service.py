@@ -0,0 +1,357 @@
+import http.client
+import json
+import os
+import queue
+import socket
+import socketserver
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas
+
+from cleaning import clean_column
+from pipeline import score_tweets
+from scoring import get_sentiment
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+DEFAULT_MAX_BATCH = 256
+DEFAULT_MAX_WAIT = 0.005
+LATENCY_WINDOW = 10000
+STOP = object()
+
+def score_texts(texts, analyzer='TextBlob'):
+    '''
+    Cleans raw tweets like the report does (p.clean then remove_punctuations) and scores them in this process
+    Returns the polarity and Positive/Neutral/Negative sentiment of every text, tweets left blank score 0
+    '''
+    keys, cleaned, blank = clean_column(pandas.Series(texts, dtype=object))
+    scores = np.zeros(len(texts))
+    if (~blank).any():
+        scores[~blank.to_numpy()] = score_tweets(cleaned[~blank], analyzer, workers=1)
+    return [{'polarity': float(score), 'sentiment': get_sentiment(score)} for score in scores]
+
+class ServiceStats:
+    '''
+    Request and batch counters of the scoring service with the latencies of the last LATENCY_WINDOW requests
+    '''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.requests = 0
+        self.texts = 0
+        self.batches = 0
+        self.errors = 0
+
+    def record_request(self, seconds, texts, error=False):
+        with self.lock:
+            self.latencies.append(seconds)
+            self.requests += 1
+            self.texts += texts
+            self.errors += error
+
+    def record_batch(self):
+        with self.lock:
+            self.batches += 1
+
+    def snapshot(self):
+        with self.lock:
+            latencies = np.array(self.latencies)
+            uptime = time.monotonic() - self.started
+            stats = {'uptime_seconds': round(uptime, 3), 'requests': self.requests, 'texts': self.texts, 'batches': self.batches,
+                     'errors': self.errors, 'requests_per_second': round(self.requests / uptime, 2) if uptime else None,
+                     'texts_per_second': round(self.texts / uptime, 2) if uptime else None,
+                     'mean_batch_size': round(self.texts / self.batches, 2) if self.batches else None}
+        for name, q in (('p50_ms', 50), ('p99_ms', 99)):
+            stats[name] = round(float(np.percentile(latencies, q)) * 1000, 3) if len(latencies) else None
+        return stats
+
+class MicroBatcher:
+    '''
+    Coalesces the texts of concurrent requests into one scoring call of at most max_batch texts,
+    waiting at most max_wait seconds after the first queued request for others to join it
+    '''
+
+    def __init__(self, score, max_batch=DEFAULT_MAX_BATCH, max_wait=DEFAULT_MAX_WAIT, stats=None):
+        self.score = score
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.stats = stats or ServiceStats()
+        self.queue = queue.Queue()
+        self.pending = None
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def submit(self, texts):
+        '''
+        Queues a request's texts, the future resolves to their results in the same order
+        A request of more than max_batch texts is queued as chunks of max_batch, so no batch grows past it
+        '''
+        texts = list(texts)
+        if len(texts) <= self.max_batch:
+            future = Future()
+            self.queue.put((texts, future))
+            return future
+        chunks = [Future() for _ in range(0, len(texts), self.max_batch)]
+        future = Future()
+        lock = threading.Lock()
+        pending = [len(chunks)]
+
+        def chunk_done(_):
+            with lock:
+                pending[0] -= 1
+                if pending[0]:
+                    return
+            errors = [chunk.exception() for chunk in chunks if chunk.exception() is not None]
+            if errors:
+                future.set_exception(errors[0])
+            else:
+                future.set_result([result for chunk in chunks for result in chunk.result()])
+
+        for i, chunk in zip(range(0, len(texts), self.max_batch), chunks):
+            chunk.add_done_callback(chunk_done)
+            self.queue.put((texts[i:i+self.max_batch], chunk))
+        return future
+
+    def next_batch(self):
+        first = self.queue.get() if self.pending is None else self.pending
+        self.pending = None
+        if first is STOP:
+            return None
+        requests = [first]
+        size = len(first[0])
+        deadline = time.monotonic() + self.max_wait
+        while size < self.max_batch:
+            try:
+                request = self.queue.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                break
+            if request is STOP or size + len(request[0]) > self.max_batch:
+                # starts the next batch, or stops the batcher once this batch is done
+                self.pending = request
+                break
+            requests.append(request)
+            size += len(request[0])
+        return requests
+
+    def run(self):
+        while True:
+            requests = self.next_batch()
+            if requests is None:
+                return
+            try:
+                results = self.score([text for texts, _ in requests for text in texts])
+                self.stats.record_batch()
+            except Exception as e:
+                for _, future in requests:
+                    future.set_exception(e)
+                continue
+            start = 0
+            for texts, future in requests:
+                future.set_result(results[start:start+len(texts)])
+                start += len(texts)
+
+    def close(self):
+        if self.thread.is_alive():
+            self.queue.put(STOP)
+            self.thread.join()
+
+def handler(batcher, tcp=True):
+    stats = batcher.stats
+
+    class Handler(BaseHTTPRequestHandler):
+        # keep-alive, every response has a Content-Length
+        protocol_version = 'HTTP/1.1'
+        # headers and body are written separately, without TCP_NODELAY the body waits for a delayed ACK
+        disable_nagle_algorithm = tcp
+
+        def send_json(self, status, body):
+            body = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == '/stats':
+                self.send_json(200, stats.snapshot())
+            elif self.path == '/health':
+                self.send_json(200, {'status': 'ok'})
+            else:
+                self.send_json(404, {'error': 'not found'})
+
+        def do_POST(self):
+            '''
+            POST /score with {"texts": [...]} or {"text": "..."}, answers {"results": [{"polarity", "sentiment"}]}
+            '''
+            if self.path != '/score':
+                return self.send_json(404, {'error': 'not found'})
+            start = time.perf_counter()
+            texts = []
+            try:
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                texts = body['texts'] if 'texts' in body else [body['text']]
+                if not isinstance(texts, list):
+                    raise TypeError('texts must be a list')
+                if not all(isinstance(text, str) for text in texts):
+                    raise ValueError('texts must be strings')
+            except (KeyError, TypeError, ValueError) as e:
+                stats.record_request(time.perf_counter() - start, 0, error=True)
+                return self.send_json(400, {'error': 'expected {"texts": [...]} or {"text": "..."}: %s' % e})
+            try:
+                results = batcher.submit(texts).result() if texts else []
+            except Exception as e:
+                stats.record_request(time.perf_counter() - start, len(texts), error=True)
+                return self.send_json(500, {'error': repr(e)})
+            stats.record_request(time.perf_counter() - start, len(texts))
+            self.send_json(200, {'results': results})
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+class ServiceHTTPServer(ThreadingHTTPServer):
+    # the default backlog of 5 resets connections when many clients connect at once
+    request_queue_size = 128
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+    def get_request(self):
+        # http.server expects a (host, port) client address
+        request, _ = super().get_request()
+        return request, ('unix', 0)
+
+class ScoringService:
+    '''
+    Long-running local scoring service keeping the cleaning steps and the analyzer loaded in memory
+    It listens on host:port, or on a Unix socket when socket_path is set, see handler for the endpoints
+    '''
+
+    def __init__(self, analyzer='TextBlob', host=DEFAULT_HOST, port=DEFAULT_PORT, socket_path=None,
+                 max_batch=DEFAULT_MAX_BATCH, max_wait=DEFAULT_MAX_WAIT):
+        self.analyzer = analyzer
+        self.socket_path = socket_path
+        # warm up: the analyzer's corpus or lexicon is loaded before the first request comes in
+        score_texts(['warm up :)'], analyzer)
+        self.batcher = MicroBatcher(lambda texts: score_texts(texts, analyzer), max_batch, max_wait)
+        self.stats = self.batcher.stats
+        if socket_path:
+            if os.path.exists(socket_path):
+                os.remove(socket_path)
+            self.httpd = ThreadingUnixHTTPServer(socket_path, handler(self.batcher, tcp=False))
+        else:
+            self.httpd = ServiceHTTPServer((host, port), handler(self.batcher))
+        self.thread = None
+
+    @property
+    def address(self):
+        return self.socket_path or 'http://%s:%d' % self.httpd.server_address[:2]
+
+    def __enter__(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def serve_forever(self):
+        print("Scoring with %s on %s" % (self.analyzer, self.address))
+        try:
+            self.httpd.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.close()
+
+    def close(self):
+        if self.thread is not None:
+            self.httpd.shutdown()
+        self.httpd.server_close()
+        self.batcher.close()
+        if self.socket_path and os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path, timeout=None):
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+def connect(address, timeout=30):
+    '''
+    HTTP connection to a service address, http://host:port or the path of its Unix socket
+    '''
+    if address.startswith('http://'):
+        host, port = address[len('http://'):].rstrip('/').split(':')
+        return http.client.HTTPConnection(host, int(port), timeout=timeout)
+    return UnixHTTPConnection(address, timeout)
+
+def request(connection, method, path, body=None):
+    connection.request(method, path, body=None if body is None else json.dumps(body), headers={'Content-Type': 'application/json'})
+    response = connection.getresponse()
+    return response.status, json.loads(response.read())
+
+def score(texts, address='http://%s:%d' % (DEFAULT_HOST, DEFAULT_PORT)):
+    '''
+    Client call scoring a list of raw tweets with a running service
+    '''
+    connection = connect(address)
+    try:
+        status, body = request(connection, 'POST', '/score', {'texts': list(texts)})
+    finally:
+        connection.close()
+    if status != 200:
+        raise RuntimeError(body.get('error'))
+    return body['results']
+
+def load_test(address, texts, requests=1000, concurrency=16, per_request=1):
+    '''
+    Sends `requests` score requests of per_request texts from `concurrency` threads, one keep-alive connection each
+    Returns the client side throughput and latencies with the service's own /stats
+    '''
+    def worker(n):
+        connection = connect(address)
+        latencies = []
+        try:
+            for k in range(n):
+                start = time.perf_counter()
+                batch = [texts[(k * per_request + i) % len(texts)] for i in range(per_request)]
+                status, _ = request(connection, 'POST', '/score', {'texts': batch})
+                if status != 200:
+                    raise RuntimeError('status %d' % status)
+                latencies.append(time.perf_counter() - start)
+        finally:
+            connection.close()
+        return latencies
+
+    shares = [requests // concurrency + (i < requests % concurrency) for i in range(concurrency)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = np.concatenate([np.array(result) for result in executor.map(worker, shares)])
+    seconds = time.perf_counter() - start
+    connection = connect(address)
+    try:
+        _, server = request(connection, 'GET', '/stats')
+    finally:
+        connection.close()
+    result = {'requests': int(len(latencies)), 'concurrency': concurrency, 'per_request': per_request, 'seconds': round(seconds, 3),
+              'requests_per_second': round(len(latencies) / seconds, 1), 'texts_per_second': round(len(latencies) * per_request / seconds, 1),
+              'p50_ms': round(float(np.percentile(latencies, 50)) * 1000, 3), 'p99_ms': round(float(np.percentile(latencies, 99)) * 1000, 3),
+              'server': server}
+    print(json.dumps(result, indent=2))
+    return result
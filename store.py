@@ -0,0 +1,144 @@
+import datetime
+import os
+import shutil
+import time
+
+import pandas
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from id_index import get_index, reset_index
+from pipeline import CREATED_AT_FORMAT
+
+PARQUET_DIR = os.path.join('data', 'parquet')
+CSV_DIR = os.path.join('data', 'csv')
+REPORT_COLUMNS = ['tweet', 'location', 'created_at']
+
+schema = pa.schema([
+    ('tweet', pa.string()),
+    ('id', pa.int64()),
+    ('name', pa.string()),
+    ('location', pa.dictionary(pa.int32(), pa.string())),
+    ('topic', pa.dictionary(pa.int32(), pa.string())),
+    ('created_at', pa.timestamp('s', tz='UTC')),
+    ('processed_on', pa.timestamp('s')),
+])
+
+def topic_dir(topic):
+    return os.path.join(PARQUET_DIR, topic)
+
+def to_table(tweets):
+    '''
+    Converts tweet records (the dicts of clean_results or a DataFrame read from csv) into a typed arrow table
+    '''
+    df = pandas.DataFrame(tweets)
+    df = pandas.DataFrame({
+        'tweet': df['tweet'].astype(object),
+        'id': pandas.to_numeric(df['id']).astype('int64'),
+        'name': df['name'].astype(object),
+        'location': df['location'].astype(object),
+        'topic': df['topic'].astype(object),
+        'created_at': pandas.to_datetime(df['created_at'], format=CREATED_AT_FORMAT, utc=True),
+        'processed_on': pandas.to_datetime(df['processed_on']),
+    })
+    return pa.Table.from_pandas(df, schema=schema, preserve_index=False)
+
+def stored_parquet_ids(topic):
+    '''
+    Ids already saved in the parquet store, used to build the id index the first time
+    '''
+    if not os.path.isdir(topic_dir(topic)):
+        return []
+    return read_tweets_parquet(topic, ['id'])['id'].to_numpy()
+
+def parquet_files(topic):
+    '''
+    Number of files in the parquet store of a topic, the size its id index is checked against
+    '''
+    if not os.path.isdir(topic_dir(topic)):
+        return 0
+    return sum(1 for entry in os.scandir(topic_dir(topic)) if entry.name.endswith('.parquet'))
+
+def save_tweets_parquet(tweets, topic, skipped_ids=None):
+    '''
+    Appends tweets to data/parquet/<topic> as a new row group file, the columnar counterpart of save_tweets_csv
+    Tweets whose id is already stored for the topic are skipped, it returns how many were skipped
+    A failed write raises, so the caller does not move its checkpoint past the page
+    The ids of the skipped tweets are appended to skipped_ids when it is given
+    '''
+    index = get_index(topic, 'parquet', lambda: stored_parquet_ids(topic), lambda: parquet_files(topic))
+    with index.lock:
+        tweets, skipped = index.filter_new(tweets, skipped_ids)
+        if not tweets:
+            print("skipped %d duplicates" % skipped)
+            return skipped
+        output_dir = topic_dir(topic)
+        os.makedirs(output_dir, exist_ok=True)
+        stamp = datetime.datetime.now().strftime('%Y%m%d%H%M%S%f')
+        pq.write_table(to_table(tweets), os.path.join(output_dir, 'part-'+stamp+'.parquet'))
+        index.add(tweets)
+    print("done inserting, skipped %d duplicates" % skipped)
+    return skipped
+
+def read_tweets_parquet(topic, columns=None):
+    '''
+    Reads only the requested columns of a topic, numeric and timestamp columns are converted without copies
+    '''
+    table = ds.dataset(topic_dir(topic), format='parquet', schema=schema).to_table(columns=columns)
+    return table.to_pandas(split_blocks=True, self_destruct=True)
+
+def iter_parquet_batches(topic, batch_size, columns=None):
+    '''
+    Yields the tweets of a topic from the parquet store as DataFrames of at most batch_size rows
+    '''
+    dataset = ds.dataset(topic_dir(topic), format='parquet', schema=schema)
+    for batch in dataset.to_batches(columns=columns, batch_size=batch_size):
+        yield batch.to_pandas()
+
+def load_topic(topic, backend='csv', columns=None):
+    '''
+    Loads the tweets of a topic from the csv files, the parquet store or its mongodb collection
+    '''
+    if backend == 'parquet':
+        return read_tweets_parquet(topic, columns)
+    if backend == 'mongo':
+        from mongo_store import read_tweets_mongo
+        return read_tweets_mongo(topic, columns)
+    return pandas.read_csv(os.path.join(CSV_DIR, topic+'.csv'), usecols=columns)
+
+def convert_csv(topics, batch_size=50000):
+    '''
+    Imports data/csv/<topic>.csv into the parquet store, replacing what was stored for the topic
+    '''
+    for topic in topics:
+        file = os.path.join(CSV_DIR, topic+'.csv')
+        if not os.path.exists(file):
+            continue
+        shutil.rmtree(topic_dir(topic), ignore_errors=True)
+        reset_index(topic, 'parquet')
+        os.makedirs(topic_dir(topic))
+        output_file = os.path.join(topic_dir(topic), 'part-0.parquet')
+        with pq.ParquetWriter(output_file, schema) as writer:
+            for batch in pandas.read_csv(file, chunksize=batch_size):
+                writer.write_table(to_table(batch))
+        print("Converted " + topic)
+
+def benchmark_storage(topics, columns=REPORT_COLUMNS, repeat=3):
+    '''
+    Compares load time and disk size of the csv files and the parquet store
+    '''
+    rows = []
+    for topic in topics:
+        csv_size = os.path.getsize(os.path.join(CSV_DIR, topic+'.csv'))
+        parquet_size = sum(entry.stat().st_size for entry in os.scandir(topic_dir(topic)))
+        for backend, size in (('csv', csv_size), ('parquet', parquet_size)):
+            for cols in (None, columns):
+                start = time.perf_counter()
+                for _ in range(repeat):
+                    load_topic(topic, backend, cols)
+                rows.append({'topic': topic, 'backend': backend, 'columns': 'all' if cols is None else ','.join(cols),
+                             'load_seconds': round((time.perf_counter() - start) / repeat, 4), 'bytes': size})
+    benchmark = pandas.DataFrame(rows)
+    print(benchmark)
+    return benchmark
@@ -0,0 +1,18 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import id_index
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    '''
+    Runs a test in an empty directory, everything is read and written under its data/ folder
+    '''
+    os.makedirs(os.path.join(tmp_path, 'data', 'csv'))
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(id_index, 'indexes', {})
+    return tmp_path
@@ -0,0 +1,80 @@
+import pandas
+import pytest
+
+import main
+from checkpoint import load_checkpoint
+from fake_twitter import FakeSearchServer, FIRST_ID
+from scheduler import TokenBucket
+from writer import BufferedWriter
+
+QUERY = '#Vaccinated -RT AND lang:en'
+
+class Killed(Exception):
+    pass
+
+@pytest.fixture
+def server(workdir):
+    with FakeSearchServer(total=350, rate_limit=50, window=1.0) as server:
+        yield server
+
+def fetch(server, **kwargs):
+    return main.query_tweet(QUERY, 10000, 'Vaccinated', api=server.api(), limiter=TokenBucket(50, 1.0), **kwargs)
+
+def stored_ids():
+    return pandas.read_csv('data/csv/Vaccinated.csv', usecols=['id'])['id'].tolist()
+
+def killed_after(pages):
+    calls = []
+    def save(tweets, topic, skipped_ids=None):
+        if len(calls) == pages:
+            raise Killed()
+        calls.append(len(tweets))
+        return main.save_tweets_csv(tweets, topic, skipped_ids)
+    return save
+
+def test_rate_limited_pages_are_retried(workdir):
+    with FakeSearchServer(total=350, rate_limit=2, window=0.5) as server:
+        assert main.query_tweet(QUERY, 10000, 'Vaccinated', api=server.api(), limiter=TokenBucket(100, 1.0)) == 0
+        assert len(server.calls) > len(server.requests) == 4
+    assert sorted(stored_ids(), reverse=True) == list(range(FIRST_ID, FIRST_ID - 350, -1))
+
+def test_killed_backfill_resumes_below_the_last_stored_page(server):
+    with pytest.raises(Killed):
+        fetch(server, save=killed_after(2))
+    assert len(stored_ids()) == 200
+    checkpoint = load_checkpoint(QUERY)
+    assert not checkpoint['complete'] and checkpoint['oldest_id'] == FIRST_ID - 199
+
+    del server.requests[:]
+    assert fetch(server) == 0
+    assert server.requests[0]['max_id'] == [str(FIRST_ID - 200)]
+    assert sorted(stored_ids(), reverse=True) == list(range(FIRST_ID, FIRST_ID - 350, -1))
+    assert load_checkpoint(QUERY)['since_id'] == FIRST_ID
+
+def test_next_run_only_fetches_newer_tweets(server):
+    fetch(server)
+    server.newest += 30
+    del server.requests[:]
+    assert fetch(server) == 0
+    assert all(request['since_id'] == [str(FIRST_ID)] for request in server.requests)
+    assert len(server.requests) == 1
+    assert stored_ids()[-30:] == list(range(FIRST_ID + 30, FIRST_ID, -1))
+    assert load_checkpoint(QUERY)['since_id'] == FIRST_ID + 30
+
+def test_writer_moves_the_checkpoint_once_pages_are_stored(server):
+    with BufferedWriter(main.save_tweets_csv, flush_size=150, flush_interval=0.05) as writer:
+        assert fetch(server, writer=writer) == 0
+        assert load_checkpoint(QUERY)['since_id'] == FIRST_ID
+        # another query over the same tweets, the duplicates the writer skipped come back through the callbacks
+        server.newest += 10
+        assert main.query_tweet('#Vaccinated', 10000, 'Vaccinated', api=server.api(), writer=writer) == 340
+    assert len(stored_ids()) == 360
+
+def test_failed_write_keeps_the_checkpoint_before_the_page(server):
+    with BufferedWriter(killed_after(1), flush_size=100, flush_interval=0.05) as writer:
+        with pytest.raises(RuntimeError):
+            fetch(server, writer=writer)
+    checkpoint = load_checkpoint(QUERY)
+    assert not checkpoint['complete'] and checkpoint['oldest_id'] == FIRST_ID - 99
+    assert fetch(server) == 0
+    assert len(stored_ids()) == 350
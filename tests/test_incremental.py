@@ -0,0 +1,30 @@
+import os
+
+from benchmark import generate_tweets
+from incremental import update_topic
+from pipeline import record_end
+
+def test_half_written_row_is_left_for_the_next_run(workdir):
+    tweets = generate_tweets(101, 'Vaccinated', duplicate_rate=0.1, seed=1)
+    # the line break falls inside the part of the last row written before the cut
+    tweets.loc[100, 'tweet'] = 'Got my\nsecond #Vaccinated shot, tired but happy'
+    head = tweets.iloc[:100].to_csv(index=False).encode('utf-8')
+    data = tweets.to_csv(index=False).encode('utf-8')
+    file = os.path.join('data', 'csv', 'Vaccinated.csv')
+    with open(file, 'wb') as f:
+        f.write(data[:len(head)+40])
+    assert record_end(file) == len(head)
+
+    partial = update_topic('Vaccinated', 'Lexicon')
+    assert partial['offset'] == len(head)
+    assert partial['rows'] == 100
+
+    with open(file, 'ab') as f:
+        f.write(data[len(head)+40:])
+    state = update_topic('Vaccinated', 'Lexicon')
+    full = update_topic('Vaccinated', 'Lexicon', full=True)
+    assert state['offset'] == full['offset'] == len(data)
+    assert state['rows'] == full['rows'] == 101
+    assert state['counts'] == full['counts']
+    assert state['words'] == full['words']
+    assert len(state['seen']) == len(full['seen'])
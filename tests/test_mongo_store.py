@@ -0,0 +1,37 @@
+import pytest
+
+import id_index
+import mongo_store
+from fake_mongo import FakeMongoClient
+
+@pytest.fixture
+def mongo(workdir, monkeypatch):
+    client = FakeMongoClient()
+    monkeypatch.setattr(mongo_store, 'client', client)
+    monkeypatch.setattr(mongo_store, 'indexed', set())
+    return client['test']
+
+def tweets(n):
+    return [{'tweet': 'tweet %d' % i, 'id': str(1000 + i), 'name': 'user', 'location': '', 'topic': 'Vaccinated',
+             'created_at': 'Tue May 11 00:00:00 +0000 2021', 'processed_on': '2021-05-11 19:14:10'} for i in range(n)]
+
+def test_saved_tweets_are_skipped(mongo):
+    assert mongo_store.save_tweets_mongo(tweets(10), 'Vaccinated', 'test') == 0
+    assert mongo_store.save_tweets_mongo(tweets(12), 'Vaccinated', 'test') == 10
+    assert mongo['Vaccinated'].estimated_document_count() == 12
+
+def test_emptied_collection_rebuilds_the_id_index(mongo):
+    mongo_store.save_tweets_mongo(tweets(10), 'Vaccinated', 'test')
+    mongo['Vaccinated'].delete_many({})
+    id_index.indexes.clear()
+    assert mongo_store.save_tweets_mongo(tweets(10), 'Vaccinated', 'test') == 0
+    assert mongo['Vaccinated'].estimated_document_count() == 10
+
+def test_duplicates_block_the_index_until_removed(mongo, caplog):
+    mongo['Vaccinated'].insert_many(tweets(10) + tweets(4))
+    mongo_store.get_collection('Vaccinated', 'test')
+    assert ('test', 'Vaccinated') not in mongo_store.indexed
+    assert 'no unique index on id for test.Vaccinated' in caplog.text
+    assert mongo_store.remove_duplicates('Vaccinated', 'test') == 4
+    assert ('test', 'Vaccinated') in mongo_store.indexed
+    assert sorted(doc['id'] for doc in mongo['Vaccinated'].find()) == [tweet['id'] for tweet in tweets(10)]
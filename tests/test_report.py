@@ -0,0 +1,21 @@
+import datetime
+
+import pandas
+
+import main
+from benchmark import generate_tweets
+from pipeline import sentiment_table
+
+TOPICS = ['ModernaVaccine', 'JohnsonAndJohnsonVaccine', 'PfizerVaccine', 'Vaccinated']
+
+def test_windowed_bars_match_between_dataframe_and_aggregates(workdir):
+    for topic in TOPICS:
+        generate_tweets(500, topic, duplicate_rate=0.1, seed=2).to_csv('data/csv/%s.csv' % topic, index=False)
+    start = datetime.datetime.fromisoformat('2021-05-10T21:00+00:00')
+    end = datetime.datetime(2021, 5, 10, 23)
+    frames = main.generate_report(analyzer='Lexicon', cache_path=None, plots=False)
+    states = main.generate_report(analyzer='Lexicon', cache_path=None, plots=False, incremental=True)
+    for topic in TOPICS:
+        windowed = sentiment_table(frames[topic], 'Lexicon', start, end)
+        assert 0 < windowed['counts'].sum() < len(frames[topic])
+        pandas.testing.assert_frame_equal(windowed, sentiment_table(states[topic], 'Lexicon', start, end))
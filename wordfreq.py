@@ -0,0 +1,45 @@
+import re
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas
+
+WORD_PATTERN = re.compile(r"\w[\w']*")
+
+def get_stopwords():
+    from wordcloud import STOPWORDS
+    return set(word.lower() for word in STOPWORDS)
+
+def count_words(tweets, counts=None, stopwords=None):
+    '''
+    Adds the word frequencies of a column of cleaned tweets to counts, a Counter kept per topic
+    Words are lowercased and tokenized like WordCloud.process_text: trailing 's, numbers and stopwords are dropped
+    '''
+    if counts is None:
+        counts = Counter()
+    if stopwords is None:
+        stopwords = get_stopwords()
+    words = pandas.Series(tweets, dtype=object).str.lower().str.findall(WORD_PATTERN).explode().dropna()
+    words = words.where(~words.str.endswith("'s"), words.str[:-2])
+    words = words[~words.str.isdigit() & ~words.isin(stopwords)]
+    counts.update(words.value_counts().to_dict())
+    return counts
+
+def normalize_plurals(counts):
+    '''
+    Folds "vaccines" into "vaccine" when both occur, as WordCloud does before drawing
+    '''
+    counts = Counter(counts)
+    for word in list(counts):
+        if word.endswith('s') and not word.endswith('ss') and word[:-1] in counts:
+            counts[word[:-1]] += counts.pop(word)
+    return counts
+
+def count_words_by_topic(tweets_by_topic, workers=None):
+    '''
+    Counts the words of several topics in parallel processes, returns {topic: Counter}
+    '''
+    topics = list(tweets_by_topic)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        counts = executor.map(count_words, [tweets_by_topic[topic] for topic in topics])
+        return dict(zip(topics, counts))
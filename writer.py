@@ -0,0 +1,124 @@
+import queue
+import threading
+import time
+from collections import Counter
+
+from metrics import stage
+
+DEFAULT_FLUSH_SIZE = 1000
+DEFAULT_FLUSH_INTERVAL = 5.0
+DEFAULT_QUEUE_SIZE = 100
+STOP = object()
+
+def page_skips(pages, skipped_ids):
+    '''
+    Splits the ids a save skipped among the pages of the flush, returns the number skipped in every page
+    Of ids repeated within the flush the save keeps the first, so they are taken from the last pages first
+    '''
+    remaining = Counter(skipped_ids)
+    counts = []
+    for page in reversed(pages):
+        count = 0
+        for tweet in reversed(page):
+            key = int(tweet['id'])
+            if remaining[key]:
+                remaining[key] -= 1
+                count += 1
+        counts.append(count)
+    return counts[::-1]
+
+class BufferedWriter:
+    '''
+    Background thread storing the tweet records pushed by the fetch threads in large batches
+    save(tweets, topic, skipped_ids=...) is save_tweets_csv, save_tweets_parquet or save_tweets, it is called once a topic
+    has flush_size records buffered, every flush_interval seconds and when the writer is closed
+    A page can come with a written(ok, skipped) callback, called from the writer thread in queue order once the flush
+    holding the page is done, ok is False when save raised and the page was not stored, skipped is the number of
+    duplicates of the page which were not stored
+    '''
+
+    def __init__(self, save, flush_size=DEFAULT_FLUSH_SIZE, flush_interval=DEFAULT_FLUSH_INTERVAL, max_queue=DEFAULT_QUEUE_SIZE):
+        self.save = save
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.buffers = {}
+        self.callbacks = {}
+        self.skipped = {}
+        self.written = 0
+        self.flushes = 0
+        self.flushed_at = time.monotonic()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def put(self, tweets, topic, written=None):
+        '''
+        Queues a page of records, blocking while the queue is full
+        Returns 0, the duplicates skipped are counted in self.skipped and passed to written once the records are written
+        '''
+        if not self.thread.is_alive():
+            raise RuntimeError('writer is closed')
+        self.queue.put((topic, tweets, written))
+        return 0
+
+    def flush(self, topic):
+        tweets = self.buffers.pop(topic, [])
+        callbacks = self.callbacks.pop(topic, [])
+        ok = True
+        skipped_ids = []
+        if tweets:
+            try:
+                with stage('write', len(tweets)) as current:
+                    skipped = self.save(tweets, topic, skipped_ids=skipped_ids)
+                    current.rows_out = len(tweets) - skipped
+                self.skipped[topic] = self.skipped.get(topic, 0) + skipped
+                self.written += len(tweets) - skipped
+                self.flushes += 1
+            except Exception as e:
+                print(e)
+                ok = False
+        counts = page_skips([page for _, page in callbacks], skipped_ids) if ok else [0] * len(callbacks)
+        for (written, _), skipped in zip(callbacks, counts):
+            try:
+                written(ok, skipped)
+            except Exception as e:
+                print(e)
+
+    def flush_all(self):
+        for topic in list(self.buffers):
+            self.flush(topic)
+        self.flushed_at = time.monotonic()
+
+    def run(self):
+        while True:
+            try:
+                item = self.queue.get(timeout=max(self.flushed_at + self.flush_interval - time.monotonic(), 0))
+            except queue.Empty:
+                item = None
+            if item is STOP:
+                self.flush_all()
+                return
+            if item is not None:
+                topic, tweets, written = item
+                self.buffers.setdefault(topic, []).extend(tweets)
+                if written is not None:
+                    self.callbacks.setdefault(topic, []).append((written, tweets))
+                if len(self.buffers[topic]) >= self.flush_size:
+                    self.flush(topic)
+            if time.monotonic() >= self.flushed_at + self.flush_interval:
+                self.flush_all()
+
+    def close(self):
+        '''
+        Writes whatever is still queued or buffered and stops the writer thread
+        '''
+        if self.thread.is_alive():
+            self.queue.put(STOP)
+            self.thread.join()
+        print("Wrote %d tweets in %d flushes, skipped %d duplicates" % (self.written, self.flushes, sum(self.skipped.values())))